@@ -0,0 +1,165 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The background data acquisition service
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+import threading
+import numpy as np
+import log
+import ts32
+from frame_ring import FrameRing
+
+class Subscriber:
+	"""
+	The frames consumer registered in the acquisition service. It has its own queue of the given depth.
+	If the queue is full the oldest frame is overwritten (drop_oldest policy) or the new frame
+	is dropped (drop_newest policy) so the slow consumer never slows down the acquisition.
+	The optional temporal filter (see filters module) is applied to the last array of the frame
+	in the consumer thread.
+	"""
+	drop_oldest = FrameRing.drop_oldest
+	drop_newest = 'drop_newest'
+
+	def __init__(self, service, depth, policy, frame_filter = None):
+		assert policy in (Subscriber.drop_oldest, Subscriber.drop_newest)
+		self.service = service
+		self.frame_filter = frame_filter
+		self.ring = FrameRing(depth, service.layout,
+				FrameRing.block if policy == Subscriber.drop_newest else FrameRing.drop_oldest)
+
+	def publish(self, seq, arrays):
+		"""Put the frame to the queue. Called by the acquisition thread."""
+		for dst, src in zip(self.ring.put(), arrays):
+			np.copyto(dst, src)
+		# Zero timeout means the new frame is dropped if the ring is full
+		self.ring.commit(0, seq)
+
+	def get(self, tout = None):
+		"""
+		Wait the next frame. Returns (seq, arrays) tuple where arrays is the list of read-only views
+		of the raw data and converted frame (if any) or None on timeout. The frame remains valid until
+		the next get call. If the filter is set the last array is replaced by the filter output.
+		Raise exception if the acquisition is failed.
+		"""
+		r = self.ring.get(tout)
+		if r is None:
+			if self.service.error is not None:
+				raise RuntimeError('acquisition failed: %s' % self.service.error[1])
+			return None
+		if self.frame_filter is None:
+			return r
+		seq, arrays = r
+		return seq, arrays[:-1] + [self.frame_filter.update(arrays[-1])]
+
+	def set_filter(self, frame_filter):
+		"""Set temporal filter or remove it if None is passed"""
+		self.frame_filter = frame_filter
+
+	def lag(self):
+		"""Returns the number of frames waiting in the queue"""
+		return self.ring.pending()
+
+	def stats(self):
+		"""Returns the queue statistics as dictionary"""
+		return self.ring.stats()
+
+	def close(self):
+		"""Unsubscribe"""
+		self.service.unsubscribe(self)
+
+class AcqService:
+	"""
+	The data acquisition service. It runs auto mode acquisition in the dedicated thread and publishes frames
+	to any number of subscribers. Every frame consists of the raw data array and optionally the result
+	of its conversion by the convert(data, out) routine (like pixels.get_image_pixels).
+	The new subscriber gets the last frame published immediately.
+	"""
+	def __init__(self, ctl, conf, convert = None):
+		"""Create service given the controller (or controllers group), the applet configuration and optional convert routine"""
+		self.ctl = ctl
+		self.conf = conf
+		self.convert = convert
+		self.subscribers = []
+		self.lock = threading.Lock()
+		self.thread = None
+		self.running = False
+		self.error = None
+		self.seq = 0
+		self.last = None
+
+	def start(self):
+		"""Initialize sensor and start acquisition thread"""
+		ctl = self.ctl
+		ctl.bus_init()
+		ts32.configure(ctl, self.conf)
+		data = ts32.acquire(ctl, self.conf)
+		frame = [data]
+		if self.convert is not None:
+			frame.append(self.convert(data, None))
+		self.layout = [(a.shape, a.dtype) for a in frame]
+		# The frames are acquired to two buffers alternately so the last published one may be
+		# passed to the new subscriber while the next one is being acquired
+		self.frames = [frame, [np.empty_like(a) for a in frame]]
+		ts32.run_auto(ctl)
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name='acquisition')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self):
+		try:
+			while self.running:
+				frame = self.frames[self.seq & 1]
+				ts32.acquire_auto(self.ctl, out=frame[0])
+				if self.convert is not None:
+					self.convert(frame[0], frame[1])
+				with self.lock:
+					for s in self.subscribers:
+						s.publish(self.seq, frame)
+					self.last = (self.seq, frame)
+				self.seq += 1
+		except:
+			self.error = sys.exc_info()
+			log.err('acquisition failed: %s', self.error[1])
+		finally:
+			self.running = False
+			with self.lock:
+				for s in self.subscribers:
+					s.ring.close()
+
+	def subscribe(self, depth = 2, policy = Subscriber.drop_oldest, frame_filter = None):
+		"""Register new subscriber given its queue depth, drop policy and optional temporal filter"""
+		assert self.thread is not None, 'the service is not started'
+		s = Subscriber(self, depth, policy, frame_filter)
+		with self.lock:
+			self.subscribers.append(s)
+			if self.last is not None:
+				s.publish(*self.last)
+			if not self.running:
+				s.ring.close()
+		return s
+
+	def latest(self):
+		"""Returns (seq, arrays) tuple with the copy of the last frame published or None if there are no frames yet"""
+		with self.lock:
+			if self.last is None:
+				return None
+			seq, frame = self.last
+			return seq, [a.copy() for a in frame]
+
+	def unsubscribe(self, s):
+		with self.lock:
+			if s in self.subscribers:
+				self.subscribers.remove(s)
+		s.ring.close()
+
+	def stop(self):
+		"""Stop acquisition thread and close the controller"""
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		self.ctl.close()
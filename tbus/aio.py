@@ -0,0 +1,154 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The minimal generator based coroutines event loop
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+#
+# The coroutine is the generator yielding the following objects:
+#
+#   Wait(fd, tout)  - suspend until fd becomes readable or timeout expires. The yield returns True
+#                     if the fd is ready. Either fd or tout may be None.
+#   generator       - run another coroutine. The yield returns its result.
+#   list            - run the list of coroutines concurrently. The yield returns the list of results.
+#   None            - let other coroutines run.
+#
+# The coroutine returns result by raising Return(result). The exceptions are propagated to the caller.
+# Example:
+#
+#   def acquire(ctl):
+#       frame = yield ts32.acquire_auto_async(ctl)
+#       raise Return(frame)
+#
+#   Loop().run_until_complete(acquire(ctl))
+#
+
+import sys
+import time
+import types
+import select
+import collections
+
+class Return(Exception):
+	"""Raised by coroutine to return the result"""
+	def __init__(self, value = None):
+		Exception.__init__(self)
+		self.value = value
+
+class Wait:
+	"""Wait readable fd or timeout"""
+	def __init__(self, fd = None, tout = None):
+		assert fd is not None or tout is not None
+		self.fd = fd
+		self.tout = tout
+
+class Task:
+	"""The running coroutine with the stack of coroutines called by it"""
+	def __init__(self, co, parent = None):
+		self.stack = [co]
+		self.parent = parent
+		self.value = None
+		self.exc = None
+		self.done = False
+		self.children = None
+
+class Loop:
+	"""The coroutines event loop"""
+	def __init__(self):
+		self.ready = collections.deque()
+		self.waiting = {}
+
+	def spawn(self, co, parent = None):
+		"""Start coroutine. Returns the task object."""
+		t = Task(co, parent)
+		self.ready.append(t)
+		return t
+
+	def run_until_complete(self, co):
+		"""Run coroutine until completion along with other coroutines. Returns its result."""
+		t = self.spawn(co)
+		while not t.done:
+			self.run_once()
+		if t.exc is not None:
+			raise t.exc[0], t.exc[1], t.exc[2]
+		return t.value
+
+	def run_once(self):
+		"""Run ready coroutines or wait the first event"""
+		if self.ready:
+			for _ in range(len(self.ready)):
+				self.step(self.ready.popleft())
+			return
+		if not self.waiting:
+			return
+		now = time.time()
+		deadlines = [d for fd, d in self.waiting.values() if d is not None]
+		tout = max(0, min(deadlines) - now) if deadlines else None
+		fds = [fd for fd, d in self.waiting.values() if fd is not None]
+		if fds:
+			r, _, _ = select.select(fds, [], [], tout)
+		else:
+			r = []
+			time.sleep(tout)
+		now = time.time()
+		for t, (fd, d) in self.waiting.items():
+			if fd is not None and fd in r:
+				t.value = True
+			elif d is not None and now >= d:
+				t.value = False
+			else:
+				continue
+			del self.waiting[t]
+			self.ready.append(t)
+
+	def step(self, t):
+		"""Resume the task until its next yield"""
+		co = t.stack[-1]
+		try:
+			if t.exc is not None:
+				exc, t.exc = t.exc, None
+				y = co.throw(exc[0], exc[1], exc[2])
+			else:
+				value, t.value = t.value, None
+				y = co.send(value)
+		except (Return, StopIteration) as e:
+			t.stack.pop()
+			t.value = e.value if isinstance(e, Return) else None
+			self.resume(t)
+			return
+		except:
+			t.stack.pop()
+			t.exc = sys.exc_info()
+			self.resume(t)
+			return
+		if isinstance(y, types.GeneratorType):
+			t.stack.append(y)
+			self.ready.append(t)
+		elif isinstance(y, Wait):
+			self.waiting[t] = (y.fd, time.time() + y.tout if y.tout is not None else None)
+		elif isinstance(y, list):
+			t.children = [self.spawn(c, t) for c in y]
+			if not t.children:
+				t.value = []
+				self.ready.append(t)
+		else:
+			assert y is None, 'unexpected %r yielded' % y
+			self.ready.append(t)
+
+	def resume(self, t):
+		"""Pass the result of the coroutine completed to its caller"""
+		if t.stack:
+			self.ready.append(t)
+			return
+		t.done = True
+		p = t.parent
+		if p is None or p.children is None:
+			return
+		if t.exc is not None and p.exc is None:
+			p.exc = t.exc
+		if all([c.done for c in p.children]):
+			if p.exc is None:
+				p.value = [c.value for c in p.children]
+			p.children = None
+			self.ready.append(p)
@@ -19,6 +19,8 @@ mod_h = len(mod_pixels)
 
 # Get the (module_index, module_origin) tuple given the pixel row, column along with the total number of modules.
 # The module_origin is the tuple containing the minimum row, column values of the module pixels (module's top left corner).
+# The resolver is called with numpy arrays of rows and columns of all pixels first and with the individual
+# pixel row and column if it fails.
 def __plain_mod_resolver(r, c, nmodules):
 	i, j = r // mod_h, c // mod_w
 	return i * modules_in_row + j, (i * mod_h, j * mod_w)
@@ -41,13 +43,37 @@ image_flipud = False
 # image_transpose = True
 image_transpose = False
 
+# Negate channel values
+channel_negate = True
+
 #
-# The channel data preprocessing function. Several examples are below.
+# The channel data preprocessing function. It takes the data array along with the arrays of module
+# and channel indexes for every image pixel. If it is set to None the image is built by single gather
+# (see channel_negate). Several examples are below.
 #
 # The simplest form - no channel processing:
 def __plain_channel_data(d, m, c): return d[m, c]
 
 #channel_data = __plain_channel_data
+#channel_data = lambda d, m, c: -d[m, c]
 
 # Use you own implementation if necessary
-channel_data = lambda d, m, c: -d[m, c]
+channel_data = None
+
+#
+# Calibration settings (see pixels.Calibration)
+#
+
+# The reference channels subtracted from all channels of the module to compensate module offset drift.
+# The mean value is subtracted if there are several channels.
+#  0: integrator off, 1: zero input, 2: test input
+calib_ref_channels = (1,)
+
+# The pixel is considered bad if its noise exceeds the median noise by this factor
+calib_noise_factor = 5.
+
+# The minimum median noise (ADC units) so the pixels are not marked bad if most of them have no noise
+calib_noise_floor = 1.
+
+# The pixel is considered bad if its response is less than this fraction of the median response
+calib_min_response = .3
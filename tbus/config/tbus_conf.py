@@ -5,6 +5,9 @@
 # The number of active channels
 nchannels = 8
 
+# The number of controllers used as single sensor. All controllers found will be used if set to None.
+controllers = None
+
 # Bus clock frequency divider. Divide the controller master clock (25MHz) to produce bit clock for SPI buses.
 tbus_clk_div = 6
 
@@ -35,3 +38,33 @@ skip_cmd_cookies = True
 # Skip SQR status check to improve performance
 skip_srq_status_check = True
 
+# Sleep waiting controller interrupt instead of busy polling if UIO device is available
+use_irq = True
+
+# The polling policy (sec) used while waiting the controller (see tbmc_dev.PollPolicy).
+# Spin for poll_spin_time, then yield CPU for poll_yield_time, then sleep doubling
+# the sleep time from poll_min_sleep up to poll_max_sleep. None keeps the PollPolicy default.
+poll_spin_time  = None
+poll_yield_time = None
+poll_min_sleep  = None
+poll_max_sleep  = None
+
+
+#
+# Simulation settings
+#
+
+# Use the software simulator instead of the real controller
+simulate = False
+
+# The number of simulated controllers
+sim_controllers = 1
+
+# The number of modules in every channel of the simulated bus
+sim_chain = 4
+
+# The simulated bus timing scale factor (0 for no delays)
+sim_time_scale = 1.
+
+# The fixed latency (sec) added to every simulated bus transaction
+sim_latency = 0.
@@ -0,0 +1,112 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The temporal filters of the data frames stream
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+#
+# Every filter takes frames one by one by update method returning the filtered frame.
+# The cost of update does not depend on the filter length. The accumulators are allocated
+# on the first frame and reused after that. The returned array remains valid until the next update.
+#
+
+import numpy as np
+
+class EMAFilter:
+	"""The exponential moving average acc += alpha * (frame - acc)"""
+	def __init__(self, alpha):
+		if not (0 < alpha and alpha <= 1):
+			raise ValueError('invalid EMA filter coefficient %r' % alpha)
+		self.alpha = alpha
+		self.reset()
+
+	def reset(self):
+		self.acc = None
+
+	def update(self, frame):
+		if self.acc is None:
+			self.acc = frame.astype(np.float32)
+			self.tmp = np.empty_like(self.acc)
+		else:
+			np.subtract(frame, self.acc, out=self.tmp)
+			self.tmp *= self.alpha
+			self.acc += self.tmp
+		return self.acc
+
+class BoxcarFilter:
+	"""
+	The mean of the last n frames maintained by running sum. The sum is exact int32 for integer frames
+	and float64 for float frames so it does not drift.
+	"""
+	def __init__(self, n):
+		if n <= 0:
+			raise ValueError('invalid boxcar filter length %r' % n)
+		self.n = n
+		self.reset()
+
+	def reset(self):
+		self.hist = None
+
+	def update(self, frame):
+		if self.hist is None:
+			self.hist = np.empty((self.n,) + frame.shape, dtype=frame.dtype)
+			self.sum = np.zeros(frame.shape, dtype=np.int32 if frame.dtype.kind in 'iu' else np.float64)
+			self.out = np.empty(frame.shape, dtype=np.float32)
+			self.pos, self.cnt = 0, 0
+		if self.cnt == self.n:
+			self.sum -= self.hist[self.pos]
+		else:
+			self.cnt += 1
+		self.sum += frame
+		self.hist[self.pos] = frame
+		self.pos = (self.pos + 1) % self.n
+		np.true_divide(self.sum, self.cnt, out=self.out)
+		return self.out
+
+class MinMaxFilter:
+	"""The running minimum and maximum since reset. The mode selects the output: min, max or range (max - min)."""
+	modes = ('min', 'max', 'range')
+
+	def __init__(self, mode = 'range'):
+		if mode not in MinMaxFilter.modes:
+			raise ValueError('invalid min / max filter mode %r' % mode)
+		self.mode = mode
+		self.reset()
+
+	def reset(self):
+		self.min = self.max = None
+
+	def update(self, frame):
+		if self.min is None:
+			self.min, self.max = frame.copy(), frame.copy()
+			self.out = np.empty_like(self.min)
+		else:
+			np.minimum(self.min, frame, out=self.min)
+			np.maximum(self.max, frame, out=self.max)
+		if self.mode == 'min':
+			return self.min
+		if self.mode == 'max':
+			return self.max
+		np.subtract(self.max, self.min, out=self.out)
+		return self.out
+
+def make_filter(spec):
+	"""
+	Create filter given its specification string: ema:<alpha>, box:<n>, min, max or range.
+	Returns None if the specification is empty. Raise ValueError if the specification is invalid.
+	"""
+	if not spec:
+		return None
+	name, _, arg = spec.partition(':')
+	try:
+		if name == 'ema':
+			return EMAFilter(float(arg))
+		if name == 'box':
+			return BoxcarFilter(int(arg))
+	except ValueError:
+		pass
+	else:
+		if name in MinMaxFilter.modes and not arg:
+			return MinMaxFilter(name)
+	raise ValueError('invalid filter specification %r' % spec)
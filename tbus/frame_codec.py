@@ -0,0 +1,151 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The data frames encoding for network streaming
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+#
+# Every encoded frame is the header followed by the frame data. The header fields are:
+#
+#   seq     - frame sequence number (uint32)
+#   height  - frame height (uint16)
+#   width   - frame width (uint16)
+#   flags   - the combination of key / compressed / quantized bits (uint8)
+#   mode    - the delta mode: raw, xor or diff (uint8)
+#   lo, hi  - the range of the quantized frame values (int16)
+#
+# The data is little-endian int16 or uint8 if quantized. The key frame data is the frame itself.
+# Other frames carry the difference (xor or wrapping subtraction) with the previous frame sent.
+# The quantization range is selected on every key frame. The data may be compressed by zlib.
+#
+
+import zlib
+import struct
+import numpy as np
+
+class FrameEncoder:
+	"""
+	The stateful frame encoder. Every stream should have its own encoder instance. The message is built
+	in the preallocated buffer leaving the room for the transport header before it so the whole message
+	may be sent by single write without copying.
+	"""
+	raw, xor, diff = 0, 1, 2
+	modes = {'raw' : raw, 'xor' : xor, 'diff' : diff}
+	key_frame, compressed, quantized = 1, 2, 4
+	hdr = struct.Struct('<IHHBBhh')
+	# The room reserved for the transport header before the message
+	headroom = 16
+
+	def __init__(self, mode = raw, key_interval = 30, level = 0, quant = False):
+		"""
+		Create encoder given delta mode, the key frames interval, the zlib compression level (0 to disable)
+		and the flag enabling 8 bit quantization. Raise ValueError if the parameters are invalid.
+		"""
+		if mode not in FrameEncoder.modes.values():
+			raise ValueError('invalid delta mode %r' % mode)
+		if key_interval <= 0:
+			raise ValueError('invalid key frames interval %r' % key_interval)
+		if level < 0 or level > 9:
+			raise ValueError('invalid compression level %r' % level)
+		self.mode = mode
+		self.key_interval = key_interval
+		self.level = level
+		self.quant = quant
+		self.cur = None
+		self.cnt = 0
+		self.lo, self.hi = 0, 0
+
+	def alloc(self, h, w):
+		dtype = np.uint8 if self.quant else np.dtype('<i2')
+		self.cur, self.ref, self.delta = [np.empty((h, w), dtype=dtype) for _ in range(3)]
+		self.tmp = np.empty((h, w), dtype=np.float32)
+		n = self.cur.nbytes
+		# The compressed data may be a bit larger than the original
+		self.buf = bytearray(FrameEncoder.headroom + FrameEncoder.hdr.size + n + (n >> 12) + (n >> 14) + 64)
+		self.view = memoryview(self.buf)
+		# The uncompressed data is put right to the message buffer
+		self.data = np.frombuffer(self.buf, dtype=dtype, count=h * w,
+				offset=FrameEncoder.headroom + FrameEncoder.hdr.size).reshape(h, w)
+
+	def encode(self, seq, frame, prefix = None):
+		"""
+		Returns encoded frame as memoryview of the internal buffer valid until the next call. The optional
+		prefix function returns the transport header (up to headroom bytes) given the message size.
+		It is put right before the message and included in the returned view.
+		"""
+		h, w = frame.shape
+		if self.cur is None:
+			self.alloc(h, w)
+		key = self.cnt % self.key_interval == 0 or self.mode == FrameEncoder.raw
+		self.cnt += 1
+		# The raw mode frames are never used as reference so they are converted right to the message buffer
+		cur = self.data if self.mode == FrameEncoder.raw and not self.level else self.cur
+		if self.quant:
+			self.quantize(frame, key, cur)
+		else:
+			np.copyto(cur, frame, casting='unsafe')
+		out = self.delta if self.level else self.data
+		if key:
+			data = cur
+		elif self.mode == FrameEncoder.xor:
+			data = np.bitwise_xor(cur, self.ref, out=out)
+		else:
+			data = np.subtract(cur, self.ref, out=out)
+		self.cur, self.ref = self.ref, self.cur
+		flags = FrameEncoder.key_frame if key else 0
+		if self.quant:
+			flags |= FrameEncoder.quantized
+		pos = FrameEncoder.headroom + FrameEncoder.hdr.size
+		if self.level:
+			flags |= FrameEncoder.compressed
+			z = zlib.compress(data, self.level)
+			size = len(z)
+			self.buf[pos:pos + size] = z
+		else:
+			if data is not self.data:
+				np.copyto(self.data, data)
+			size = data.nbytes
+		start = FrameEncoder.headroom
+		FrameEncoder.hdr.pack_into(self.buf, start, seq & 0xffffffff, h, w, flags, self.mode, self.lo, self.hi)
+		if prefix is not None:
+			p = prefix(FrameEncoder.hdr.size + size)
+			assert len(p) <= start
+			self.buf[start - len(p):start] = p
+			start -= len(p)
+		return self.view[start:pos + size]
+
+	def quantize(self, frame, key, out):
+		"""Map frame values from lo..hi range to 0..255 putting the result to out"""
+		if key:
+			self.lo, self.hi = int(frame.min()), int(frame.max())
+		np.subtract(frame, self.lo, out=self.tmp)
+		self.tmp *= 255. / max(1, self.hi - self.lo)
+		self.tmp += .5
+		np.clip(self.tmp, 0, 255, out=self.tmp)
+		np.copyto(out, self.tmp, casting='unsafe')
+
+class FrameDecoder:
+	"""The decoder of the frames stream produced by FrameEncoder"""
+	def __init__(self):
+		self.ref = None
+
+	def decode(self, msg):
+		"""Returns (seq, frame) tuple given the message string. The quantized frames are restored as float32 arrays."""
+		seq, h, w, flags, mode, lo, hi = FrameEncoder.hdr.unpack_from(msg)
+		data = msg[FrameEncoder.hdr.size:]
+		if flags & FrameEncoder.compressed:
+			data = zlib.decompress(data)
+		dtype = np.uint8 if flags & FrameEncoder.quantized else np.dtype('<i2')
+		d = np.frombuffer(data, dtype=dtype).reshape(h, w)
+		if flags & FrameEncoder.key_frame:
+			self.ref = d.copy()
+		elif self.ref is None:
+			raise RuntimeError('delta frame %u without key frame' % seq)
+		elif mode == FrameEncoder.xor:
+			np.bitwise_xor(self.ref, d, out=self.ref)
+		else:
+			np.add(self.ref, d, out=self.ref)
+		if flags & FrameEncoder.quantized:
+			return seq, lo + self.ref * np.float32((hi - lo) / 255.)
+		return seq, self.ref.copy()
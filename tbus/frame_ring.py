@@ -0,0 +1,146 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The ring of preallocated data frames
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import time
+import threading
+import collections
+import numpy as np
+
+class FrameRing:
+	"""
+	The fixed capacity ring of preallocated frames passed from the producer to the consumer.
+	Every frame consists of one or more numpy arrays described by the list of (shape, dtype) tuples.
+	The producer fills the arrays returned by put in place and publishes them by commit. The consumer
+	gets read-only views of the published frames along with their sequence numbers. If the ring is full
+	the producer either overwrites the oldest unread frame (drop_oldest policy) or waits the consumer
+	(block policy). In the latter case the new frame is dropped if the wait is timed out.
+	The ring has single consumer since only one frame may be held by the consumer at a time. The frames
+	may be distributed to several consumers by giving every one its own ring (see acq_service).
+	"""
+	drop_oldest = 'drop_oldest'
+	block       = 'block'
+
+	def __init__(self, capacity, layout, policy = drop_oldest):
+		"""Create ring given the number of frames it may hold, the frame layout and the policy"""
+		assert capacity > 0
+		assert policy in (FrameRing.drop_oldest, FrameRing.block)
+		self.capacity = capacity
+		self.policy = policy
+		# The extra slots are being written by producer and being read by consumer
+		slots = capacity + 2
+		self.arrays = [np.empty((slots,) + tuple(shape), dtype=dtype) for shape, dtype in layout]
+		self.frames = [[a[i] for a in self.arrays] for i in range(slots)]
+		self.views = [[FrameRing.readonly(a[i]) for a in self.arrays] for i in range(slots)]
+		self.cond = threading.Condition()
+		self.queue = collections.deque()
+		self.free = range(1, slots)
+		self.wr = 0
+		self.held = None
+		self.holder = None
+		self.seq = 0
+		self.closed = False
+		self.committed = 0
+		self.overwritten = 0
+		self.dropped = 0
+
+	@staticmethod
+	def readonly(a):
+		v = a.view()
+		v.flags.writeable = False
+		return v
+
+	def put(self):
+		"""Returns the list of arrays to put the next frame to"""
+		return self.frames[self.wr]
+
+	def commit(self, tout = None, seq = None):
+		"""
+		Publish the frame put to the arrays returned by put. The frames are numbered sequentially unless
+		the caller provides the sequence number. Returns the sequence number of the frame or None if it was dropped.
+		"""
+		with self.cond:
+			if len(self.queue) >= self.capacity:
+				if self.policy == FrameRing.block:
+					if not self.wait_(lambda: len(self.queue) < self.capacity, tout):
+						self.dropped += 1
+						return None
+				else:
+					_, slot = self.queue.popleft()
+					self.free.append(slot)
+					self.overwritten += 1
+			if seq is None:
+				seq = self.seq
+			self.seq = seq + 1
+			self.committed += 1
+			self.queue.append((seq, self.wr))
+			self.wr = self.free.pop()
+			self.cond.notify_all()
+			return seq
+
+	def get(self, tout = None):
+		"""
+		Wait the next frame. Returns (seq, arrays) tuple where arrays is the list of read-only views
+		of the frame arrays or None on timeout or if the ring is closed and empty. The frame remains valid
+		until the next get or release call. Raise exception if the frame is held by another thread.
+		"""
+		with self.cond:
+			self.check_holder_()
+			self.release_()
+			if not self.wait_(lambda: self.queue or self.closed, tout) or not self.queue:
+				return None
+			seq, self.held = self.queue.popleft()
+			self.holder = threading.current_thread()
+			self.cond.notify_all()
+			return seq, self.views[self.held]
+
+	def release(self):
+		"""Release the frame returned by get"""
+		with self.cond:
+			self.check_holder_()
+			self.release_()
+			self.cond.notify_all()
+
+	def close(self):
+		"""Wake up the consumer. The get will not wait for new frames after that."""
+		with self.cond:
+			self.closed = True
+			self.cond.notify_all()
+
+	def check_holder_(self):
+		if self.held is not None and self.holder is not threading.current_thread():
+			raise RuntimeError('the frame ring has single consumer, the frame is held by %s' % self.holder.name)
+
+	def release_(self):
+		if self.held is not None:
+			self.free.append(self.held)
+			self.held = None
+
+	def wait_(self, pred, tout):
+		"""Wait condition with the lock held. Returns False on timeout."""
+		deadline = time.time() + tout if tout is not None else None
+		while not pred():
+			if deadline is None:
+				self.cond.wait()
+			else:
+				left = deadline - time.time()
+				if left <= 0:
+					return False
+				self.cond.wait(left)
+		return True
+
+	def pending(self):
+		"""Returns the number of unread frames"""
+		return len(self.queue)
+
+	def stats(self):
+		"""Returns the ring statistics as dictionary"""
+		return {
+			'frames'      : self.committed,
+			'pending'     : len(self.queue),
+			'overwritten' : self.overwritten,
+			'dropped'     : self.dropped,
+		}
@@ -12,57 +12,95 @@ import mmap
 import mmio
 
 class MmDev:
-	def __init__(self, name, cls = 'amba_pl'):
-		"""Open device given its name"""
-		self.name = name
+	# the registers memory mapping or None if closed
+	map = None
+
+	@staticmethod
+	def find(name, cls = 'amba_pl'):
+		"""Returns the sorted list of addresses of the device instances given the device name"""
+		addrs = []
 		for path in glob.glob('/proc/device-tree/' + cls + '/' + name + '@*'):
 			n, addr = os.path.basename(path).split('@')
 			assert n == name
-			self.addr = int(addr, 16)			
-			break
-		else:
-			raise RuntimeError(name + ' not found')
+			addrs.append(int(addr, 16))
+		return sorted(addrs)
+
+	def __init__(self, name, cls = 'amba_pl', bench_reg = None, index = 0):
+		"""
+		Open device given its name and the instance index in the order of addresses. The caller may
+		provide the index of the register that may be read without side effects to choose the fastest
+		IO backend (see mmio.open_io).
+		"""
+		self.name = name
+		addrs = MmDev.find(name, cls)
+		if index >= len(addrs):
+			raise RuntimeError('%s #%d not found' % (name, index))
+		self.addr = addrs[index]
 
 		assert self.addr % 4096 == 0
 		with open('/dev/mem', 'r+') as f:
 			self.map = mmap.mmap(f.fileno(), 4096, offset=self.addr)
+		self.io = mmio.open_io(self.map, bench_reg)
 
 	def __str__(self):
 		return '%s@%x' % (self.name, self.addr)
 
+	def close(self):
+		"""Unmap the device registers. The device can't be used after that."""
+		if self.map is not None:
+			self.io = None
+			self.map.close()
+			self.map = None
+
 	def peek(self, reg):
 		"""Peek 32 bit value from the device register given its index"""
-		return mmio.peek(ctypes.pointer(ctypes.c_uint.from_buffer(self.map, 4*reg)))
+		return self.io.peek(reg)
 
 	def poke(self, reg, val):
 		"""Poke 32 bit value to the device register given its index"""
-		r = mmio.poke(ctypes.pointer(ctypes.c_uint.from_buffer(self.map, 4*reg)), val)
-		assert r == 0
+		self.io.poke(reg, val)
+
+	@staticmethod
+	def buff_size(buff):
+		"""Returns the size in bytes of the writable buffer object"""
+		return len(buffer(buff))
+
+	@staticmethod
+	def buff_addr(buff, off = 0):
+		"""Returns the address of the writable buffer object at the given byte offset"""
+		return ctypes.addressof(ctypes.c_char.from_buffer(buff, off))
+
+	@staticmethod
+	def buff_byte(buff, off):
+		"""Returns the byte value of the writable buffer object at the given byte offset"""
+		return ctypes.c_ubyte.from_buffer(buff, off).value
 
 	def read(self, reg, sz):
 		"""Read data buffer from 32 bit wide device register given its index"""
-		assert sz & 3 == 0
 		buff = ctypes.create_string_buffer(sz)
-		r = mmio.read(
-				ctypes.pointer(ctypes.c_uint.from_buffer(self.map, 4*reg)),
-				ctypes.pointer(ctypes.c_uint.from_buffer(buff)),
-				sz >> 2
-			)
-		assert r == 0
+		self.readinto(reg, buff, sz)
 		return buff
 
+	def readinto(self, reg, buff, sz = None, off = 0):
+		"""
+		Read data from 32 bit wide device register given its index into the caller supplied
+		writable buffer (ctypes buffer, bytearray or numpy array) starting at the given byte offset.
+		If the size is not specified the buffer will be filled up to the end. Returns the number of bytes read.
+		"""
+		if sz is None:
+			sz = self.buff_size(buff) - off
+		assert sz & 3 == 0
+		assert off + sz <= self.buff_size(buff)
+		self.io.read(reg, buff, off, sz >> 2)
+		return sz
+
 	def write(self, reg, str):
 		"""Write data buffer to 32 bit wide device register given its index"""
 		sz = len(str)
 		if (sz & 3) != 0:
 			sz += 4 - (sz & 3)
 		buff = ctypes.create_string_buffer(str, sz)
-		r = mmio.write(
-				ctypes.pointer(ctypes.c_uint.from_buffer(self.map, 4*reg)),
-				ctypes.pointer(ctypes.c_uint.from_buffer(buff)),
-				sz >> 2
-			)
-		assert r == 0
+		self.io.write(reg, buff, sz >> 2)
 
 	def write16(self, reg, str):
 		"""Write data buffer to 16 bit wide device register given its index"""
@@ -70,12 +108,7 @@ class MmDev:
 		if (sz & 1) != 0:
 			sz += 2 - (sz & 1)
 		buff = ctypes.create_string_buffer(str, sz)
-		r = mmio.write16(
-				ctypes.pointer(ctypes.c_uint.from_buffer(self.map, 4*reg)),
-				ctypes.pointer(ctypes.c_ushort.from_buffer(buff)),
-				sz >> 1
-			)
-		assert r == 0
+		self.io.write16(reg, buff, sz >> 1)
 
 	def read_ex(self, reg, sz, prefix = None, skipz = 0):
 		"""
@@ -89,25 +122,30 @@ class MmDev:
 		may exceed size requested in sz parameter. The suiffix may be passed as prefix parameter to
 		the next call to this routine.
 		"""
-		assert sz & 1 == 0
-		assert not (prefix is not None and sipz)
 		if prefix is not None:
 			buff = ctypes.create_string_buffer(prefix, sz + 2)
 			plen = len(prefix)
-			assert plen & 1 == 0
-			assert plen < sz
 		else:
 			buff = ctypes.create_string_buffer(sz + 2)
 			plen = 0
-		r = mmio.read16_ex(
-				ctypes.pointer(ctypes.c_uint.from_buffer(self.map, 4*reg)),
-				ctypes.pointer(ctypes.c_ushort.from_buffer(buff, plen)),
-				(sz - plen) >> 1, skipz
-			)
+		return buff, self.read_ex_into(reg, buff, sz, plen, skipz)
+
+	def read_ex_into(self, reg, buff, sz, plen = 0, skipz = 0):
+		"""
+		The read_ex counterpart filling the caller supplied writable buffer (ctypes buffer, bytearray
+		or numpy array) of at least sz + 2 bytes. The first plen bytes of the buffer are treated as prefix
+		already read, so they are expected to be filled by the caller. Returns the number of bytes read
+		(including prefix).
+		"""
+		assert sz & 1 == 0
+		assert not (plen and skipz)
+		assert plen & 1 == 0
+		assert plen < sz
+		assert sz + 2 <= self.buff_size(buff)
+		r = self.io.read16_ex(reg, buff, plen, (sz - plen) >> 1, skipz)
 		assert r >= 0
 		r <<= 1
 		assert r >= sz - plen or r == 0
 		assert r <= sz - plen + 2
 		assert r != 0 or skipz
-		return buff, plen + r
-
+		return plen + r
@@ -6,30 +6,166 @@
 # Author: Oleg Volkov olegv142@gmail.com
 
 from ctypes import *
+import time
+import numpy as np
 
 #
 # libmmio is simple library exporting the following functions
-# 
+#
 # uint32_t mm_peek(uint32_t const* addr)
 # int mm_poke(uint32_t* addr, uint32_t val)
 # int mm_read(uint32_t const* addr, uint32_t* buff, unsigned word_cnt)
 # int mm_write(uint32_t* addr, uint32_t const* buff, unsigned word_cnt)
 # int mm_write16(uint32_t* addr, uint16_t const* buff, unsigned word_cnt)
 # int mm_read16_ex(uint32_t volatile const* addr, uint16_t* buff, unsigned word_cnt, unsigned skipz)
+#
+# If the library is not available the numpy based implementation is used instead.
+#
+
+try:
+	libmmio = CDLL('libmmio.so.1.0')
+except OSError:
+	libmmio = None
+
+if libmmio is not None:
+	peek      = libmmio.mm_peek
+	poke      = libmmio.mm_poke
+	read      = libmmio.mm_read
+	write     = libmmio.mm_write
+	write16   = libmmio.mm_write16
+	read16_ex = libmmio.mm_read16_ex
+
+	peek.argtypes = [POINTER(c_uint)]
+	peek.restype = c_uint
+	poke.argtypes = [POINTER(c_uint), c_uint]
+	read.argtypes = [POINTER(c_uint), POINTER(c_uint), c_uint]
+	write.argtypes = [POINTER(c_uint), POINTER(c_uint), c_uint]
+	write16.argtypes = [POINTER(c_uint), POINTER(c_ushort), c_uint]
+	read16_ex.argtypes = [POINTER(c_uint), POINTER(c_ushort), c_uint, c_uint]
+
+#
+# The IO backends. They access registers by index and transfer data to / from
+# the writable buffer objects (ctypes buffer, bytearray or numpy array)
+# given the byte offset and the number of words.
+#
+
+class LibIO:
+	"""The libmmio based IO backend"""
+	name = 'lib'
+
+	def __init__(self, map):
+		self.map = map
+		self.regs = {}
+
+	def reg_ptr(self, reg):
+		"""Returns the cached pointer to the device register given its index"""
+		ptr = self.regs.get(reg)
+		if ptr is None:
+			ptr = self.regs[reg] = pointer(c_uint.from_buffer(self.map, 4*reg))
+		return ptr
+
+	def peek(self, reg):
+		return peek(self.reg_ptr(reg))
+
+	def poke(self, reg, val):
+		r = poke(self.reg_ptr(reg), val)
+		assert r == 0
+
+	def read(self, reg, buff, off, cnt):
+		r = read(self.reg_ptr(reg), pointer(c_uint.from_buffer(buff, off)), cnt)
+		assert r == 0
+
+	def write(self, reg, buff, cnt):
+		r = write(self.reg_ptr(reg), pointer(c_uint.from_buffer(buff)), cnt)
+		assert r == 0
+
+	def write16(self, reg, buff, cnt):
+		r = write16(self.reg_ptr(reg), pointer(c_ushort.from_buffer(buff)), cnt)
+		assert r == 0
+
+	def read16_ex(self, reg, buff, off, cnt, skipz):
+		return read16_ex(self.reg_ptr(reg), pointer(c_ushort.from_buffer(buff, off)), cnt, skipz)
+
+class NpIO:
+	"""
+	The numpy based IO backend. The data registers are FIFOs so every word should be
+	transferred by separate memory access. We are using take / put with repeated indexes
+	for that, the index arrays are cached.
+	"""
+	name = 'np'
+
+	def __init__(self, map):
+		self.regs = np.frombuffer(map, dtype=np.uint32)
+		self.index = {}
+
+	def reg_index(self, reg, cnt):
+		"""Returns the cached index array of the given length with all elements equal to register index"""
+		ind = self.index.get((reg, cnt))
+		if ind is None:
+			ind = self.index[(reg, cnt)] = np.full(cnt, reg, dtype=np.intp)
+		return ind
+
+	def peek(self, reg):
+		return int(self.regs[reg])
+
+	def poke(self, reg, val):
+		self.regs[reg] = val
+
+	def read(self, reg, buff, off, cnt):
+		out = np.frombuffer(buff, dtype=np.uint32, count=cnt, offset=off)
+		np.take(self.regs, self.reg_index(reg, cnt), out=out)
+
+	def write(self, reg, buff, cnt):
+		self.regs.put(self.reg_index(reg, cnt), np.frombuffer(buff, dtype=np.uint32, count=cnt))
+
+	def write16(self, reg, buff, cnt):
+		self.regs.put(self.reg_index(reg, cnt), np.frombuffer(buff, dtype=np.uint16, count=cnt))
+
+	def read16_ex(self, reg, buff, off, cnt, skipz):
+		out = np.frombuffer(buff, dtype=np.uint16, count=cnt + 1, offset=off)
+		pos = 0
+		if skipz:
+			# Skip leading zero 16 bit words
+			for _ in xrange(skipz):
+				w = int(self.regs[reg])
+				if w:
+					break
+			else:
+				return 0
+			if w & 0xffff:
+				out[0], out[1], pos = w & 0xffff, w >> 16, 2
+			else:
+				out[0], pos = w >> 16, 1
+		n = (cnt - pos + 1) // 2
+		if n > 0:
+			out[pos:pos+2*n] = np.take(self.regs, self.reg_index(reg, n)).view(np.uint16)
+		return pos + 2 * n
+
+# The backend to use: None for automatic selection, 'lib' or 'np'
+backend = None
+
+# The number of iterations of the backend selection benchmark
+bench_loops = 100
+
+def bench(io, reg):
+	"""Measure time taken by peeking and reading the register given its index"""
+	buff = create_string_buffer(256)
+	started = time.time()
+	for _ in xrange(bench_loops):
+		io.peek(reg)
+		io.read(reg, buff, 0, len(buff) >> 2)
+	return time.time() - started
 
-libmmio = CDLL('libmmio.so.1.0')
-
-peek      = libmmio.mm_peek
-poke      = libmmio.mm_poke
-read      = libmmio.mm_read
-write     = libmmio.mm_write
-write16   = libmmio.mm_write16
-read16_ex = libmmio.mm_read16_ex
-
-peek.argtypes = [POINTER(c_uint)]
-peek.restype = c_uint
-poke.argtypes = [POINTER(c_uint), c_uint]
-read.argtypes = [POINTER(c_uint), POINTER(c_uint), c_uint]
-write.argtypes = [POINTER(c_uint), POINTER(c_uint), c_uint]
-write16.argtypes = [POINTER(c_uint), POINTER(c_ushort), c_uint]
-read16_ex.argtypes = [POINTER(c_uint), POINTER(c_ushort), c_uint, c_uint]
+def open_io(map, bench_reg = None):
+	"""
+	Create IO backend instance for the given memory map. The numpy based backend is used
+	if libmmio is not available. If the caller provides the index of the register that may be read
+	without side effects, both backends will be benchmarked and the fastest one will be chosen.
+	"""
+	if backend == 'np' or libmmio is None:
+		assert backend != 'lib', 'libmmio is not available'
+		return NpIO(map)
+	if backend == 'lib' or bench_reg is None:
+		return LibIO(map)
+	ios = LibIO(map), NpIO(map)
+	return min(ios, key=lambda io: bench(io, bench_reg))
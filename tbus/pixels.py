@@ -8,26 +8,42 @@
 import numpy as np
 import config.pix_conf as pconf
 
-pmap = None
+# The pixel maps cache indexed by (nmodules, config_key()) tuple
+pmaps = {}
 
-def build_pixels_map(nmodules):
-	"""Build module / channel to pixel mapping"""
-	global pmap
+def config_key():
+	"""Returns the hashable key representing the pixels configuration"""
+	return (
+		pconf.modules_in_row, pconf.mod_pixels, pconf.mod_resolver,
+		pconf.image_fliplr, pconf.image_flipud, pconf.image_transpose
+	)
+
+def resolve_modules(rows, cols, nmodules):
+	"""Returns the module index and module origin arrays for every image pixel"""
+	try:
+		m_ind, (mr, mc) = pconf.mod_resolver(rows, cols, nmodules)
+		m_ind, mr, mc = [np.broadcast_to(a, rows.shape).astype(int) for a in (m_ind, mr, mc)]
+	except (TypeError, ValueError):
+		# The resolver does not accept arrays
+		m_ind, mr, mc = [np.empty(rows.shape, dtype=int) for _ in range(3)]
+		for r, c in zip(rows.flat, cols.flat):
+			m_ind[r, c], (mr[r, c], mc[r, c]) = pconf.mod_resolver(r, c, nmodules)
+	return m_ind, mr, mc
+
+def build_pixels_map(nmodules, nchannels):
+	"""
+	Build module / channel to pixel mapping. Returns (m_ind, c_ind, f_ind) tuple of the module index,
+	channel index and the index in the flattened (nmodules, nchannels) data array for every image pixel.
+	"""
 	assert nmodules % pconf.modules_in_row == 0
 
 	sensor_width  = pconf.modules_in_row * pconf.mod_w
 	sensor_height = (nmodules / pconf.modules_in_row) * pconf.mod_h
 
-	# The module index for every image pixel
-	m_ind = np.empty((sensor_height, sensor_width), dtype=int)
-	# The channel index for every image pixel
-	c_ind = np.empty((sensor_height, sensor_width), dtype=int)
-
-	for r in range(sensor_height):
-		for c in range(sensor_width):
-			m_ind[r, c], (mr, mc) = pconf.mod_resolver(r, c, nmodules)
-			assert mr <= r and mc <= c
-			c_ind[r, c] = pconf.mod_pixels[r - mr][c - mc]
+	rows, cols = np.mgrid[0:sensor_height, 0:sensor_width]
+	m_ind, mr, mc = resolve_modules(rows, cols, nmodules)
+	assert (mr <= rows).all() and (mc <= cols).all()
+	c_ind = np.array(pconf.mod_pixels)[rows - mr, cols - mc]
 
 	if pconf.image_fliplr:
 		m_ind, c_ind = np.fliplr(m_ind), np.fliplr(c_ind)
@@ -36,13 +52,155 @@ def build_pixels_map(nmodules):
 	if pconf.image_transpose:
 		m_ind, c_ind = np.transpose(m_ind), np.transpose(c_ind)
 
-	pmap = (m_ind, c_ind)
+	m_ind, c_ind = np.ascontiguousarray(m_ind), np.ascontiguousarray(c_ind)
+	return m_ind, c_ind, m_ind * nchannels + c_ind
 
-def get_image_pixels(data):
-	"""Convert data array to image array according to pixels config"""
+def get_pixels_map(nmodules, nchannels):
+	"""Returns the cached pixels map (see build_pixels_map)"""
+	key = (nmodules, nchannels, config_key())
+	pmap = pmaps.get(key)
 	if pmap is None:
-		build_pixels_map(data.shape[0])
+		pmap = pmaps[key] = build_pixels_map(nmodules, nchannels)
+	return pmap
+
+def get_image_pixels(data, out = None):
+	"""
+	Convert data array to image array according to pixels config.
+	The caller may provide the array to put the image to.
+	"""
+	m_ind, c_ind, f_ind = get_pixels_map(*data.shape)
+	if pconf.channel_data is not None:
+		pixs = pconf.channel_data(data, m_ind, c_ind)
+		if out is None:
+			return pixs
+		np.copyto(out, pixs)
+		return out
+
+	if out is None:
+		out = np.empty(f_ind.shape, dtype=data.dtype)
+	np.take(np.ascontiguousarray(data).reshape(-1), f_ind, out=out)
+	if pconf.channel_negate:
+		np.negative(out, out=out)
+	return out
+
+class Calibration:
+	"""
+	The per-pixel calibration of raw data frames. The calibrated value is (d - ref - offset) * gain
+	where ref is the mean of the module reference channels values (see pix_conf.calib_ref_channels).
+	The bad pixels are replaced by the mean of their good neighbors in the image. All operations are
+	performed in place on the output array using preallocated buffers.
+	"""
+	def __init__(self, offset, gain, bad):
+		"""Create calibration given the (nmodules, nchannels) arrays of offsets, gains and bad pixels flags"""
+		assert offset.shape == gain.shape == bad.shape
+		self.offset = offset.astype(np.float32)
+		self.gain = gain.astype(np.float32)
+		self.bad = bad.astype(bool)
+		self.refs = tuple(pconf.calib_ref_channels)
+		self.bad_ind, self.nbr_ind, self.nbr_w = self.replacement()
+		self.ref = np.empty((offset.shape[0], 1), dtype=np.float32)
+		self.nbr_val = np.empty(self.nbr_ind.shape, dtype=np.float32)
+		self.bad_val = np.empty(self.bad_ind.shape, dtype=np.float32)
+		self.work = np.empty(offset.shape, dtype=np.float32)
+
+	@staticmethod
+	def pixel_channels():
+		"""Returns the array of channel indexes used for image pixels"""
+		return np.unique(np.array(pconf.mod_pixels))
+
+	@staticmethod
+	def normalize(frames):
+		"""Subtract the mean of reference channels values from the stack of frames. Returns float32 array."""
+		frames = np.asarray(frames, dtype=np.float32)
+		return frames - frames[..., list(pconf.calib_ref_channels)].mean(axis=-1, keepdims=True)
+
+	@staticmethod
+	def build(dark, flat = None):
+		"""
+		Build calibration given the stack of N frames captured without illumination and optionally
+		the stack of N frames captured with uniform illumination, both are (N, nmodules, nchannels) arrays.
+		The dark frames give offsets, the illuminated ones give gains. The pixels having too large noise
+		or too small response are marked bad.
+		"""
+		dark = Calibration.normalize(dark)
+		offset = dark.mean(axis=0)
+		noise = dark.std(axis=0)
+		pix = Calibration.pixel_channels()
+		bad = np.zeros(offset.shape, dtype=bool)
+		bad[:, pix] = noise[:, pix] > pconf.calib_noise_factor * max(np.median(noise[:, pix]), pconf.calib_noise_floor)
+		gain = np.ones(offset.shape, dtype=np.float32)
+		if flat is not None:
+			resp = Calibration.normalize(flat).mean(axis=0) - offset
+			level = np.median(resp[:, pix])
+			good = np.zeros(offset.shape, dtype=bool)
+			# The response may be negative so compare it with the median relatively
+			good[:, pix] = resp[:, pix] / level > pconf.calib_min_response
+			gain[good] = level / resp[good]
+			bad[:, pix] |= ~good[:, pix]
+		return Calibration(offset, gain, bad)
+
+	@staticmethod
+	def capture(acquire, n):
+		"""Capture the stack of n frames by calling acquire() routine (like ts32.acquire_auto)"""
+		return np.array([acquire() for _ in range(n)])
+
+	def save(self, path):
+		"""Save calibration tables to .npy file"""
+		np.save(path, np.array([self.offset, self.gain, self.bad], dtype=np.float32))
+
+	@staticmethod
+	def load(path):
+		"""Load calibration tables from .npy file"""
+		offset, gain, bad = np.load(path)
+		return Calibration(offset, gain, bad != 0)
+
+	def replacement(self):
+		"""
+		Build bad pixels replacement tables. Returns the flat indexes of bad pixels, (nbad, 4) array of
+		flat indexes of their neighbors and the array of neighbors weights.
+		"""
+		f_ind = get_pixels_map(*self.offset.shape)[2]
+		h, w = f_ind.shape
+		bad_img = self.bad.reshape(-1)[f_ind]
+		rows, cols = np.nonzero(bad_img)
+		nbr_ind = np.zeros((len(rows), 4), dtype=np.intp)
+		nbr_w = np.zeros((len(rows), 4), dtype=np.float32)
+		for k, (dr, dc) in enumerate(((-1, 0), (1, 0), (0, -1), (0, 1))):
+			r, c = rows + dr, cols + dc
+			valid = (r >= 0) & (r < h) & (c >= 0) & (c < w)
+			r, c = np.clip(r, 0, h - 1), np.clip(c, 0, w - 1)
+			nbr_ind[:, k] = f_ind[r, c]
+			nbr_w[:, k] = valid & ~bad_img[r, c]
+		cnt = nbr_w.sum(axis=1)
+		nbr_w[cnt > 0] /= cnt[cnt > 0, np.newaxis]
+		return f_ind[rows, cols], nbr_ind, nbr_w
 
-	m_ind, c_ind = pmap
-	return pconf.channel_data(data, m_ind, c_ind)
+	def apply(self, data, out = None):
+		"""Calibrate data frame. The caller may provide contiguous float32 array to put the result to."""
+		if out is None:
+			out = np.empty(data.shape, dtype=np.float32)
+		elif not out.flags.c_contiguous:
+			raise ValueError('the output array is not contiguous')
+		r = self.refs[0]
+		np.copyto(self.ref, data[:, r:r+1])
+		for r in self.refs[1:]:
+			self.ref += data[:, r:r+1]
+		if len(self.refs) > 1:
+			self.ref *= 1. / len(self.refs)
+		np.subtract(data, self.ref, out=out)
+		out -= self.offset
+		out *= self.gain
+		if len(self.bad_ind):
+			flat = out.reshape(-1)
+			np.take(flat, self.nbr_ind, out=self.nbr_val)
+			self.nbr_val *= self.nbr_w
+			np.sum(self.nbr_val, axis=1, out=self.bad_val)
+			flat[self.bad_ind] = self.bad_val
+		return out
 
+	def convert(self, data, out = None):
+		"""
+		Calibrate data frame and convert it to image (see get_image_pixels). May be used as convert routine
+		for ts32.frame_ring or AcqService. The caller may provide float32 array to put the image to.
+		"""
+		return get_image_pixels(self.apply(data, self.work), out)
@@ -6,7 +6,11 @@
 # Author: Oleg Volkov olegv142@gmail.com
 
 from mmdev import MmDev
+from uio import UIO
+from aio import Return, Wait
+import ctypes
 import time
+import numpy as np
 
 class TRIG:
 	# Trigger bits (index)
@@ -33,6 +37,158 @@ class STATUS:
 	# Bits indicating fatal error
 	failure   = error | underrun
 
+class PollPolicy:
+	"""
+	The strategy of waiting the controller. The waiter spins for spin_time, then yields CPU
+	for yield_time, then sleeps starting from min_sleep and doubling the sleep time up to max_sleep.
+	The max_sleep limits the latency so it should be small compared to the expected frame period.
+	If the interrupt is available the waiter sleeps waiting it after spinning instead.
+	The policy also accumulates waiting statistics. It has single waiter reused by every wait
+	so the device should not be waited by several threads at once.
+	"""
+	# the number of polls between checking the time while spinning
+	check_every = 16
+	# the maximum time of waiting interrupt before checking status again (sec)
+	irq_poll_interval = .01
+
+	def __init__(self, spin_time = 100e-6, yield_time = 1e-3, min_sleep = 10e-6, max_sleep = 200e-6):
+		self.spin_time  = spin_time
+		self.yield_time = yield_time
+		self.min_sleep  = min_sleep
+		self.max_sleep  = max_sleep
+		self.w = PollWaiter(self)
+		self.reset_stats()
+
+	def reset_stats(self):
+		self.waits = 0
+		self.polls = 0
+		self.yields = 0
+		self.sleeps = 0
+		self.wait_time = 0.
+		self.sleep_time = 0.
+
+	def stats(self):
+		"""
+		Returns the waiting statistics as dictionary. The sleep_time is the time spent sleeping
+		or waiting the interrupt, the busy_time is the rest of the wait time spent polling.
+		"""
+		return {
+			'waits'      : self.waits,
+			'polls'      : self.polls,
+			'yields'     : self.yields,
+			'sleeps'     : self.sleeps,
+			'wait_time'  : self.wait_time,
+			'sleep_time' : self.sleep_time,
+			'busy_time'  : self.wait_time - self.sleep_time,
+		}
+
+	def waiter(self, tout = None, irq = None, idle_cb = None):
+		"""
+		Start waiting given the optional timeout, interrupt and idle callback. The idle callback
+		if provided replaces the policy pause. Returns the policy waiter.
+		"""
+		return self.w.start(tout, irq, idle_cb)
+
+class PollWaiter:
+	"""The wait state. The idle should be called after every unsuccessful poll."""
+	def __init__(self, policy):
+		self.policy = policy
+
+	def start(self, tout, irq, idle_cb):
+		"""Start new wait"""
+		self.irq     = irq
+		self.idle_cb = idle_cb
+		self.started = self.now = time.time()
+		self.deadline = self.started + tout if tout else None
+		self.polls = 0
+		self.sleep = self.policy.min_sleep
+		self.armed = False
+		return self
+
+	def expired(self):
+		"""Check if the timeout is expired"""
+		return self.deadline is not None and self.now > self.deadline
+
+	def idle(self):
+		"""Pause after unsuccessful poll"""
+		p = self.policy
+		self.polls += 1
+		if self.idle_cb is not None:
+			self.idle_cb()
+			self.now = time.time()
+			return
+		elapsed = self.now - self.started
+		if elapsed < p.spin_time:
+			if not self.polls % PollPolicy.check_every:
+				self.now = time.time()
+			return
+		if self.irq is not None:
+			if self.armed:
+				tout = PollPolicy.irq_poll_interval
+				if self.deadline is not None:
+					tout = max(0, min(tout, self.deadline - self.now))
+				self.irq.wait(tout)
+				p.sleeps += 1
+			else:
+				# The caller will poll once more after arming
+				self.irq.arm()
+			self.armed = not self.armed
+		elif elapsed < p.spin_time + p.yield_time:
+			time.sleep(0)
+			p.yields += 1
+			self.now = time.time()
+			return
+		else:
+			sleep = self.sleep
+			if self.deadline is not None:
+				sleep = max(0, min(sleep, self.deadline - self.now))
+			time.sleep(sleep)
+			p.sleeps += 1
+			self.sleep = min(2 * self.sleep, p.max_sleep)
+		self.slept()
+
+	def idle_async(self):
+		"""
+		The coroutine version of idle (see aio). It never spins or blocks. Instead it suspends waiting
+		the interrupt if available or the timeout growing from min_sleep up to max_sleep otherwise.
+		"""
+		p = self.policy
+		self.polls += 1
+		if self.irq is not None:
+			if not self.armed:
+				# The caller will poll once more after arming
+				self.irq.arm()
+				self.armed = True
+				return
+			tout = PollPolicy.irq_poll_interval
+			if self.deadline is not None:
+				tout = max(0, min(tout, self.deadline - self.now))
+			if (yield Wait(self.irq.fileno(), tout)):
+				self.irq.ack()
+			self.armed = False
+			p.sleeps += 1
+		else:
+			sleep = self.sleep
+			if self.deadline is not None:
+				sleep = max(0, min(sleep, self.deadline - self.now))
+			yield Wait(None, sleep)
+			p.sleeps += 1
+			self.sleep = min(2 * self.sleep, p.max_sleep)
+		self.slept()
+
+	def slept(self):
+		"""Update current time accounting the time passed since the last poll as sleep time"""
+		now = time.time()
+		self.policy.sleep_time += now - self.now
+		self.now = now
+
+	def done(self):
+		"""Account wait completion"""
+		p = self.policy
+		p.waits += 1
+		p.polls += self.polls
+		p.wait_time += time.time() - self.started
+
 class TBMCDev(MmDev):
 	"""TBUS controller core implementation"""
 	name = 'axi_tbmc'
@@ -52,6 +208,8 @@ class TBMCDev(MmDev):
 	rd_status      = 1
 	rd_input_state = 2
 	rd_rx_buff     = 6
+	# the configuration registers having their values cached in the shadow
+	shadow_regs    = (wr_cfg_ctl, wr_freq_ctl, wr_rst_ctl, wr_cmd_ctl, wr_rx_ctl)
 
 	# other constants:
 	master_clk = 25000000
@@ -61,12 +219,46 @@ class TBMCDev(MmDev):
 	max_rx_length  = 2048
 	# the amount of data that may safely read in streaming mode provided that the data_rdy status is set
 	rx_buff_chunk  = max_rx_length / 2
+	# the number of receive buffers in the pool. The buffer returned by the
+	# receive routine remains valid until that number of subsequent reads.
+	rx_pool_size   = 2
+	# the interrupt raised on data_rdy / completed status (see UIO) or None if not available
+	irq = None
+
+	def __init__(self, index = 0, irq = True):
+		"""
+		Create device instance given the controller index. The interrupt will be used
+		for waiting if irq parameter is True and the UIO device is available.
+		"""
+		MmDev.__init__(self, TBMCDev.name, bench_reg = TBMCDev.rd_version, index = index)
+		try:
+			self.init()
+		except:
+			self.close()
+			raise
+		if irq:
+			self.irq = UIO.open(self.addr)
 
-	def __init__(self):
-		"""Create device instance"""
-		MmDev.__init__(self, TBMCDev.name)
+	@staticmethod
+	def count():
+		"""Returns the number of controllers available"""
+		return len(MmDev.find(TBMCDev.name))
+
+	def init(self):
+		"""Initialize device instance once the IO backend is opened"""
 		self.read_version()
 		self.stash = None
+		self.rx_pool_init()
+		self.poll = PollPolicy()
+		self.shadow_invalidate()
+		self.writes_avoided = 0
+
+	def close(self):
+		"""Close the interrupt and unmap the device registers"""
+		if self.irq is not None:
+			self.irq.close()
+			self.irq = None
+		MmDev.close(self)
 
 	def read_version(self):
 		"""Read controller version information"""
@@ -84,23 +276,64 @@ class TBMCDev(MmDev):
 				TBMCDev.name, self.version, self.channels
 			)
 
+	def fileno(self):
+		"""
+		Returns the interrupt file descriptor to be used with select / epoll or None if interrupt
+		is not available. The interrupt should be armed by irq_arm before waiting.
+		"""
+		return self.irq.fileno() if self.irq is not None else None
+
+	def irq_arm(self):
+		"""Enable interrupt. The caller should check the status after that to not miss the event."""
+		self.irq.arm()
+
+	def irq_wait(self, deadline = None):
+		"""Wait armed interrupt but not past the deadline. Returns True if the interrupt has fired."""
+		tout = PollPolicy.irq_poll_interval
+		if deadline is not None:
+			tout = max(0, min(tout, deadline - time.time()))
+		return self.irq.wait(tout)
+
 	def status(self):
 		"""Read controller status"""
 		return self.peek(TBMCDev.rd_status) & 0xffff
 
 	def wait_status(self, set_bits, clr_bits = 0, tout = None):
-		"""Wait the particular status bits to be set or cleared"""
-		if tout:
-			deadline = time.time() + tout
-		while True:
-			st = self.status()
-			if (st & set_bits) == set_bits and (st & clr_bits) == 0:
-				break
-			if (st & STATUS.failure):
-				raise RuntimeError('%s has failure status %#x' % (self, st))
-			if tout and time.time() > deadline:
-				raise RuntimeError('%s timeout (%f sec) waiting status %#x/%#x, current status %#x' %
-					(self, tout, set_bits & 0xffff, clr_bits & 0xffff, st))
+		"""
+		Wait the particular status bits to be set or cleared. The status is polled according
+		to the polling policy, the interrupt is used for waiting if available.
+		"""
+		w = self.poll.waiter(tout, self.irq)
+		try:
+			while True:
+				st = self.status()
+				if (st & set_bits) == set_bits and (st & clr_bits) == 0:
+					break
+				if (st & STATUS.failure):
+					raise RuntimeError('%s has failure status %#x' % (self, st))
+				if w.expired():
+					raise RuntimeError('%s timeout (%f sec) waiting status %#x/%#x, current status %#x' %
+						(self, tout, set_bits & 0xffff, clr_bits & 0xffff, st))
+				w.idle()
+		finally:
+			w.done()
+
+	def wait_status_async(self, set_bits, clr_bits = 0, tout = None):
+		"""The coroutine version of wait_status (see aio)"""
+		w = self.poll.waiter(tout, self.irq)
+		try:
+			while True:
+				st = self.status()
+				if (st & set_bits) == set_bits and (st & clr_bits) == 0:
+					break
+				if (st & STATUS.failure):
+					raise RuntimeError('%s has failure status %#x' % (self, st))
+				if w.expired():
+					raise RuntimeError('%s timeout (%f sec) waiting status %#x/%#x, current status %#x' %
+						(self, tout, set_bits & 0xffff, clr_bits & 0xffff, st))
+				yield w.idle_async()
+		finally:
+			w.done()
 
 	def wait_ready(self, tout = None):
 		"""Wait ready status (after reset or srq)"""
@@ -127,11 +360,43 @@ class TBMCDev(MmDev):
 		"""Trigger action"""
 		if what == TRIG.reset:
 			self.stash = None
+			self.shadow_invalidate()
 		self.poke(TBMCDev.wr_triggers, 1 << what)
 
+	def shadow_invalidate(self):
+		"""Forget the cached configuration register values so the next configuration writes are not skipped"""
+		self.shadow = {}
+		# The command buffer content
+		self.cmd_cached = None
+
+	def shadow_flush(self):
+		"""Write all cached configuration register values to the controller"""
+		for reg, val in self.shadow.items():
+			self.poke(reg, val)
+
+	def configure(self, reg, val):
+		"""
+		Write configuration register unless it already has the same value according
+		to the shadow cache. The writes skipped are counted in writes_avoided.
+		"""
+		assert reg in TBMCDev.shadow_regs
+		if self.shadow.get(reg) == val:
+			self.writes_avoided += 1
+			return
+		self.poke(reg, val)
+		self.shadow[reg] = val
+
 	def configure_chans(self, channels):
 		"""Setup the number of active channels"""
-		self.poke(TBMCDev.wr_cfg_ctl, channels - 1)
+		self.configure(TBMCDev.wr_cfg_ctl, channels - 1)
+
+	@staticmethod
+	def freq_ctl(div, interval, xinterval):
+		"""Returns the frequency control register value (see configure_freq)"""
+		assert 0 < div and div <= 256
+		assert 2 < interval and interval < 256
+		assert 2 < xinterval and xinterval < 256
+		return (div - 1) | (interval << 8) | (xinterval << 24)
 
 	def configure_freq(self, div, interval, xinterval):
 		"""
@@ -139,25 +404,36 @@ class TBMCDev(MmDev):
 		transmission modes. The resulting bus clock frequency will be 25/div MHz.
 		The interval units are the half of the bus clock period.
 		"""
-		assert 0 < div and div <= 256
-		assert 2 < interval and interval < 256
-		assert 2 < xinterval and xinterval < 256
-		self.poke(TBMCDev.wr_freq_ctl, (div - 1) | (interval << 8) | (xinterval << 24))
+		self.configure(TBMCDev.wr_freq_ctl, self.freq_ctl(div, interval, xinterval))
 
 	def configure_rst(self, rst_time, rst_hold):
 		"""Setup reset parameters - reset time and clock hold time for hard reset, both in usec."""
 		assert 0 < rst_time and rst_time < 256
 		assert 0 < rst_hold and rst_hold < 256
-		self.poke(TBMCDev.wr_rst_ctl, rst_time | (rst_hold << 8))
+		self.configure(TBMCDev.wr_rst_ctl, rst_time | (rst_hold << 8))
 
-	def configure_tx(self, cmd_length, tx_fast = False, b16 = False, loop = False):
-		"""Setup transmit parameters - command length, fast mode, 16 bit mode and looping mode for self testing"""
+	@staticmethod
+	def tx_ctl(cmd_length, tx_fast = False, b16 = False, loop = False):
+		"""Returns the transmit control register value (see configure_tx)"""
 		assert 0 < cmd_length and cmd_length <= TBMCDev.max_cmd_length
 		v = cmd_length - 1
 		if tx_fast : v |= 1 << 10
 		if b16     : v |= 1 << 11
 		if loop    : v |= 1 << 15
-		self.poke(TBMCDev.wr_cmd_ctl, v)
+		return v
+
+	def configure_tx(self, cmd_length, tx_fast = False, b16 = False, loop = False):
+		"""Setup transmit parameters - command length, fast mode, 16 bit mode and looping mode for self testing"""
+		self.configure(TBMCDev.wr_cmd_ctl, self.tx_ctl(cmd_length, tx_fast, b16, loop))
+
+	@staticmethod
+	def rx_ctl(rx_length, skip = 0, wait = False, loopback = False):
+		"""Returns the receive control register value (see configure_rx)"""
+		assert 0 <= rx_length and rx_length <= TBMCDev.max_rx_length
+		v = rx_length - 1 if rx_length > 0 else 1 << 14
+		if wait     : v |= 1 << 13
+		if loopback : v |= 1 << 15
+		return v | (skip << 16)
 
 	def configure_rx(self, rx_length, skip = 0, wait = False, loopback = False):
 		"""
@@ -165,16 +441,33 @@ class TBMCDev(MmDev):
 		streaming mode and loopback flag used for self testing. The streaming mode will be set if response length
 		argument is zero. In such case the receiving must be stopped explicitly by sending TRIG.stop
 		"""
-		assert 0 <= rx_length and rx_length <= TBMCDev.max_rx_length
-		v = rx_length - 1 if rx_length > 0 else 1 << 14
-		if wait     : v |= 1 << 13
-		if loopback : v |= 1 << 15
-		self.poke(TBMCDev.wr_rx_ctl, v | (skip << 16))
+		self.configure(TBMCDev.wr_rx_ctl, self.rx_ctl(rx_length, skip, wait, loopback))
 
 	def cmd_put(self, buff):
-		"""Write command string to the command buffer"""
+		"""
+		Write command string to the command buffer. The write is skipped if the buffer
+		already has the same content.
+		"""
 		assert len(buff) <= TBMCDev.max_cmd_length
+		if buff == self.cmd_cached:
+			self.writes_avoided += 1
+			return
 		self.write16(TBMCDev.wr_cmd_buff, buff)
+		self.cmd_cached = buff
+
+	def cmd_start(self, cmd, freq, tx, rx):
+		"""
+		Configure the transmission, put command string to the command buffer and start its
+		transmission. The freq, tx, rx are the values of the corresponding control registers
+		as returned by freq_ctl, tx_ctl, rx_ctl. The configuration registers already having
+		the required values according to the shadow cache are not written as well as the command
+		buffer already having the same command. So repeating the same command takes just the trigger write.
+		"""
+		self.configure(TBMCDev.wr_freq_ctl, freq)
+		self.configure(TBMCDev.wr_cmd_ctl, tx)
+		self.configure(TBMCDev.wr_rx_ctl, rx)
+		self.cmd_put(cmd)
+		self.poke(TBMCDev.wr_triggers, 1 << TRIG.start)
 
 	@staticmethod
 	def round32(sz):
@@ -188,18 +481,46 @@ class TBMCDev(MmDev):
 		if sz & 1: sz += 1
 		return sz
 
+	def rx_pool_init(self):
+		"""Allocate the pool of receive buffers large enough to hold data from all channels"""
+		# Reserve extra room for 32 bit rounding and possible suffix
+		sz = self.channels * TBMCDev.max_rx_length + 4
+		self.rx_pool = [ctypes.create_string_buffer(sz) for _ in range(TBMCDev.rx_pool_size)]
+		self.rx_pool_next = 0
+		self.rx_ranges = {}
+
+	def rx_pool_get(self):
+		"""Returns the next buffer from the receive buffer pool"""
+		buff = self.rx_pool[self.rx_pool_next]
+		self.rx_pool_next = (self.rx_pool_next + 1) % TBMCDev.rx_pool_size
+		return buff
+
+	def rx_buff_ranges(self, sz, chs):
+		"""Returns the cached list of channel slices given the channel data size and the number of channels"""
+		ranges = self.rx_ranges.get((sz, chs))
+		if ranges is None:
+			sz_ = self.round16(sz)
+			ranges = self.rx_ranges[(sz, chs)] = [slice(i*sz_, i*sz_+sz) for i in range(chs)]
+		return ranges
+
 	def rx_buff_read(self, sz):
 		"""Read data from the receiver buffer"""
 		buff, range = self.rx_buff_read_(sz)
 		return buff[range]
 
-	def rx_buff_read_(self, sz):
-		"""Read data from the receiver buffer. Returns buffer, slice tuple."""
+	def rx_buff_read_(self, sz, buff = None):
+		"""
+		Read data from the receiver buffer. Returns buffer, slice tuple.
+		The caller may provide writable buffer to read data into. Otherwise the buffer
+		from the receive buffer pool will be used.
+		"""
 		# Round to 4 bytes boundary Note that you can read any number
 		# of bytes past the end of the buffer. They will be zero.
 		sz_ = self.round32(sz)
-		buff = self.read(TBMCDev.rd_rx_buff, sz_)
-		assert sz == sz_ or buff[sz] == '\0'
+		if buff is None:
+			buff = self.rx_pool_get()
+		self.readinto(TBMCDev.rd_rx_buff, buff, sz_)
+		assert sz == sz_ or not self.buff_byte(buff, sz)
 		return buff, slice(0, sz)
 
 	def rx_buff_read_all(self, sz, chs):
@@ -207,15 +528,25 @@ class TBMCDev(MmDev):
 		buff, ranges = self.rx_buff_read_all_(sz, chs)
 		return [buff[r] for r in ranges]
 
-	def rx_buff_read_all_(self, sz, chs):
+	@staticmethod
+	def rx_buff_array(buff, ranges):
+		"""
+		Returns 2D uint8 array (channel, byte) viewing the receive buffer given the buffer, slice list tuple
+		as returned by the receive routines. The array remains valid as long as the buffer is valid.
+		"""
+		sz = ranges[0].stop - ranges[0].start
+		stride = ranges[1].start - ranges[0].start if len(ranges) > 1 else sz
+		return np.ndarray((len(ranges), sz), dtype=np.uint8, buffer=buff, offset=ranges[0].start, strides=(stride, 1))
+
+	def rx_buff_read_all_(self, sz, chs, buff = None):
 		"""
 		Read data from the receiver buffer for all channels.
-		Returns buffer, slice list tuple.
+		Returns buffer, slice list tuple. The caller may provide writable buffer to read data into.
 		"""
 		sz_ = self.round16(sz)
 		assert 0 < sz_ and sz_ <= TBMCDev.max_rx_length
-		buff = self.rx_buff_read(sz_ * chs)
-		return buff, [slice(i*sz_, i*sz_+sz) for i in range(chs)]
+		buff, _ = self.rx_buff_read_(sz_ * chs, buff)
+		return buff, self.rx_buff_ranges(sz, chs)
 
 	def rx_buff_read_all_on_ready(self, sz, chs, tout = None, idle_cb = None):
 		"""
@@ -225,50 +556,114 @@ class TBMCDev(MmDev):
 		buff, ranges = self.rx_buff_read_all_on_ready_(sz, chs, tout, idle_cb)
 		return [buff[r] for r in ranges]
 
-	def rx_buff_read_all_on_ready_(self, sz, chs, tout = None, idle_cb = None):
+	def rx_buff_read_all_on_ready_(self, sz, chs, tout = None, idle_cb = None, buff = None):
 		"""
 		Read data string from the receiver buffer for all channels waiting until the data is ready.
-		The caller may provide optional timeout and idle callback.
+		The caller may provide optional timeout, idle callback and writable buffer to read data into.
+		If no idle callback is provided the routine waits according to the polling policy.
 		Returns buffer, slice list tuple.
 		"""
-		def do_idle():
-			time.sleep(0)
-		if idle_cb is None:
-			idle_cb = do_idle
-		if tout:
-			deadline = time.time() + tout
-		while True:
-			res = self.rx_buff_read_all_skipz_(sz, chs)
-			if res is not None:
-				return res
-			if tout and time.time() > deadline:
-				raise RuntimeError('%s timeout (%f sec) waiting data (%d bytes) for %d channels, status %#x'\
-					% (self, tout, sz, chs, self.status()))
-			idle_cb()
-
-	def rx_buff_read_all_skipz_(self, sz, chs, skipz_count = 64):
+		w = self.poll.waiter(tout, self.irq, idle_cb)
+		try:
+			while True:
+				res = self.rx_buff_read_all_skipz_(sz, chs, buff = buff)
+				if res is not None:
+					return res
+				if w.expired():
+					raise RuntimeError('%s timeout (%f sec) waiting data (%d bytes) for %d channels, status %#x'\
+						% (self, tout, sz, chs, self.status()))
+				w.idle()
+		finally:
+			w.done()
+
+	def rx_buff_read_all_on_ready_async(self, sz, chs, tout = None, buff = None):
+		"""The coroutine version of rx_buff_read_all_on_ready_ (see aio)"""
+		w = self.poll.waiter(tout, self.irq)
+		try:
+			while True:
+				res = self.rx_buff_read_all_skipz_(sz, chs, buff = buff)
+				if res is not None:
+					raise Return(res)
+				if w.expired():
+					raise RuntimeError('%s timeout (%f sec) waiting data (%d bytes) for %d channels, status %#x'\
+						% (self, tout, sz, chs, self.status()))
+				yield w.idle_async()
+		finally:
+			w.done()
+
+	def rx_buff_read_all_skipz_(self, sz, chs, skipz_count = 64, buff = None):
 		"""
 		Read data string from the receiver buffer for all channels skipping leading zero words.
 		The zero words are read whenever data is not ready. In case the data is not ready the routine
 		just give up quickly and return None. Returns buffer, slice list tuple on success.
+		The caller may provide writable buffer to read data into. It must have at least 2 extra bytes
+		past the end of the data for possible suffix.
 		"""
 		sz_ = self.round16(sz)
 		assert 0 < sz_ and sz_ <= TBMCDev.max_rx_length
 		total = sz_ * chs
 
-		buff, bsz = self.read_ex(TBMCDev.rd_rx_buff, total, self.stash,
-			skipz_count if self.stash is None else 0)
+		if buff is None:
+			buff = self.rx_pool_get()
+
+		plen = 0
+		if self.stash is not None:
+			# Put the suffix of the previous read to the beginning of the buffer
+			src, off, plen = self.stash
+			ctypes.memmove(self.buff_addr(buff), self.buff_addr(src, off), plen)
+
+		bsz = self.read_ex_into(TBMCDev.rd_rx_buff, buff, total, plen,
+			skipz_count if not plen else 0)
 
 		if not bsz:
 			# data not ready
 			return None
 
-		if bsz > total and buff[total] != '\0':
-			self.stash = buff[total:bsz]
+		if bsz > total and self.buff_byte(buff, total):
+			self.stash = (buff, total, bsz - total)
 		else:
 			self.stash = None
 
-		return buff, [slice(i*sz_, i*sz_+sz) for i in range(chs)]
+		return buff, self.rx_buff_ranges(sz, chs)
+
+def open_dev(cfg, index = 0):
+	"""Open controller device given its index. Returns the simulated one if requested by configuration."""
+	if getattr(cfg, 'simulate', False):
+		from tbmc_sim import TBMCSim
+		dev = TBMCSim(cfg.nchannels, cfg.sim_chain, cfg.sim_time_scale, cfg.sim_latency,
+				first_module = index * cfg.nchannels * cfg.sim_chain)
+	else:
+		dev = TBMCDev(index, getattr(cfg, 'use_irq', True))
+	# The policy parameters not set in configuration keep their default values
+	params = {}
+	for name in ('spin_time', 'yield_time', 'min_sleep', 'max_sleep'):
+		val = getattr(cfg, 'poll_' + name, None)
+		if val is not None:
+			params[name] = val
+	dev.poll = PollPolicy(**params)
+	return dev
+
+def open_devs(cfg):
+	"""Open all controller devices according to configuration"""
+	if getattr(cfg, 'simulate', False):
+		cnt = cfg.sim_controllers
+	else:
+		cnt = TBMCDev.count()
+	if getattr(cfg, 'controllers', None) is not None:
+		if cfg.controllers > cnt:
+			raise RuntimeError('%d controllers required, %d found' % (cfg.controllers, cnt))
+		cnt = cfg.controllers
+	if not cnt:
+		raise RuntimeError(TBMCDev.name + ' not found')
+	devs = []
+	try:
+		for i in range(cnt):
+			devs.append(open_dev(cfg, i))
+	except:
+		for dev in devs:
+			dev.close()
+		raise
+	return devs
 
 
 if __name__ == '__main__':
@@ -0,0 +1,296 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The TBMC core simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import ctypes
+import time
+from tbmc_dev import TBMCDev, TRIG, STATUS
+from tmod_sim import TModSim, process_cmds
+
+class SimIO:
+	"""
+	The IO backend emulating TBMC core registers. The bus transactions complete after the
+	simulated time computed from the bus clock and idle intervals configured multiplied by the
+	time scale plus fixed latency. In auto mode the core repeats SRQ followed by the last command
+	transmission and put responses to the receiver buffer until it becomes full.
+	"""
+	name = 'sim'
+	version = 1
+
+	def __init__(self, channels, chain, time_scale = 1., latency = 0., applet = None, first_module = 0):
+		self.channels   = channels
+		self.chain      = chain
+		self.time_scale = time_scale
+		self.latency    = latency
+		self.modules = [
+				[TModSim(first_module + ch * chain + i, applet) for i in range(chain)] for ch in range(channels)
+			]
+		self.regs = [0] * 8
+		self.regs[TBMCDev.wr_cfg_ctl] = channels - 1
+		self.cmd_buff = bytearray(TBMCDev.max_cmd_length)
+		self.cmd_wr = 0
+		self.ready_at = 0
+		self.underrun = False
+		self.rx_reset()
+
+	def rx_reset(self):
+		"""Stop any transmission and clear receiver buffer"""
+		self.rx = bytearray()
+		self.rx_pos = 0
+		self.pending = None
+		self.done_at = None
+		self.auto = False
+		self.stream = None
+		self.paused = False
+
+	#
+	# Configuration
+	#
+
+	def active_channels(self):
+		return 1 + (self.regs[TBMCDev.wr_cfg_ctl] & 0x3ff)
+
+	def tx_cmd(self):
+		"""Returns the command transmitted"""
+		return str(self.cmd_buff[:1 + (self.regs[TBMCDev.wr_cmd_ctl] & 0x3ff)])
+
+	def byte_time(self, fast = False):
+		"""Returns the simulated byte transmission time"""
+		v = self.regs[TBMCDev.wr_freq_ctl]
+		div, interval, xinterval = 1 + (v & 0xff), (v >> 8) & 0xff, (v >> 24) & 0xff
+		return self.time_scale * (16 + (xinterval if fast else interval)) * div / (2. * TBMCDev.master_clk)
+
+	def rx_config(self):
+		"""Returns the (rx_length, skip, loopback) tuple. The rx_length is zero in streaming mode."""
+		v = self.regs[TBMCDev.wr_rx_ctl]
+		rx_len = 0 if v & (1 << 14) else 1 + (v & 0x7ff)
+		return rx_len, v >> 16, bool(v & (1 << 15))
+
+	#
+	# Data generation
+	#
+
+	def loopback_data(self, off, sz):
+		"""Returns sz bytes of the loopback stream starting from the given offset"""
+		cmd, loop = self.tx_cmd(), self.regs[TBMCDev.wr_cmd_ctl] & (1 << 15)
+		if loop:
+			off %= len(cmd)
+			data = cmd[off:]
+			while len(data) < sz:
+				data += cmd
+		else:
+			data = cmd[off:]
+		return data[:sz] + '\0' * (sz - len(data))
+
+	def response(self):
+		"""Returns the response data block for all active channels"""
+		rx_len, skip, loopback = self.rx_config()
+		sz = TBMCDev.round16(rx_len)
+		if loopback:
+			return (self.loopback_data(skip, rx_len) + '\0' * (sz - rx_len)) * self.active_channels()
+		cmd = self.tx_cmd()
+		data = ''
+		for ch in range(self.active_channels()):
+			r = process_cmds(self.modules[ch], cmd)[:rx_len]
+			data += r + '\0' * (sz - len(r))
+		return data
+
+	def srq(self):
+		"""Execute SRQ on all modules. Returns execution time."""
+		t = 0
+		for ch in range(self.active_channels()):
+			for m in self.modules[ch]:
+				t = max(t, m.srq())
+		return t
+
+	def tx_time(self):
+		"""Returns the command transmission time"""
+		rx_len, skip, loopback = self.rx_config()
+		fast = self.regs[TBMCDev.wr_cmd_ctl] & (1 << 10)
+		return self.latency + (rx_len + skip) * self.byte_time(fast)
+
+	def update(self):
+		"""Update state according to the current time"""
+		now = time.time()
+		if self.pending is not None and now >= self.done_at:
+			self.rx += self.pending
+			self.pending = None
+		if self.stream is not None:
+			chunk = TBMCDev.rx_buff_chunk
+			while not self.paused and now >= self.stream_next:
+				if self.rx_avail() >= 2 * chunk * self.active_channels():
+					self.paused = True
+					break
+				self.rx += self.loopback_data(self.stream_off, chunk) * self.active_channels()
+				self.stream_off += chunk
+				self.stream_next += chunk * self.byte_time()
+		elif self.auto:
+			while not self.paused and now >= self.auto_next:
+				data = self.response()
+				if self.rx_avail() + len(data) > TBMCDev.max_rx_length * self.active_channels():
+					self.paused = True
+					break
+				self.rx += data
+				self.auto_next += self.srq() * self.time_scale + self.tx_time()
+		return now
+
+	def rx_avail(self):
+		return len(self.rx) - self.rx_pos
+
+	def rx_pop(self, sz):
+		"""Returns up to sz bytes from the receiver buffer"""
+		data = self.rx[self.rx_pos:self.rx_pos+sz]
+		self.rx_pos += len(data)
+		if self.rx_pos >= len(self.rx):
+			self.rx, self.rx_pos = bytearray(), 0
+		if self.paused and self.rx_avail() < TBMCDev.rx_buff_chunk * self.active_channels():
+			# Resume receiving
+			self.paused = False
+			if self.stream is not None:
+				self.stream_next = max(self.stream_next, time.time())
+			else:
+				self.auto_next = max(self.auto_next, time.time())
+		return data
+
+	def status(self):
+		now = self.update()
+		st = 0
+		if now >= self.ready_at:
+			st |= STATUS.ready
+		if self.stream is not None:
+			st |= STATUS.active
+			if self.rx_avail() >= TBMCDev.rx_buff_chunk * self.active_channels():
+				st |= STATUS.data_rdy
+			if self.paused:
+				st |= STATUS.pause
+		elif self.auto:
+			st |= STATUS.active
+			if self.paused:
+				st |= STATUS.pause
+		elif self.done_at is not None:
+			if now >= self.done_at:
+				st |= STATUS.tx_done | STATUS.data_rdy | STATUS.completed
+			else:
+				st |= STATUS.active
+		if self.underrun:
+			st |= STATUS.underrun
+		return st
+
+	def trigger(self, what):
+		now = time.time()
+		if what == TRIG.reset:
+			self.rx_reset()
+			self.underrun = False
+			for chain in self.modules:
+				for m in chain:
+					m.reset()
+			self.ready_at = now + self.latency + 1e-6 * self.time_scale * (self.regs[TBMCDev.wr_rst_ctl] & 0xff)
+		elif what == TRIG.srq:
+			self.rx_reset()
+			self.ready_at = now + self.latency + self.time_scale * self.srq()
+		elif what == TRIG.start:
+			self.rx_reset()
+			rx_len, skip, loopback = self.rx_config()
+			if rx_len:
+				self.pending = self.response()
+				self.done_at = now + self.tx_time()
+			else:
+				self.stream = True
+				self.stream_off = skip
+				self.stream_next = now + TBMCDev.rx_buff_chunk * self.byte_time()
+		elif what == TRIG.stop:
+			self.stream = None
+		elif what == TRIG.auto:
+			self.auto = True
+			self.auto_next = now + self.srq() * self.time_scale + self.tx_time()
+		self.cmd_wr = 0
+
+	#
+	# IO backend interface
+	#
+
+	def peek(self, reg):
+		if reg == TBMCDev.rd_version:
+			return (TBMCDev.magic << 16) | (SimIO.version << 10) | (self.channels - 1)
+		if reg == TBMCDev.rd_status:
+			return self.status()
+		if reg == TBMCDev.rd_input_state:
+			return 0 if time.time() >= self.ready_at else (1 << self.active_channels()) - 1
+		if reg == TBMCDev.rd_rx_buff:
+			buff = ctypes.create_string_buffer(4)
+			self.read(reg, buff, 0, 1)
+			return ctypes.c_uint.from_buffer(buff).value
+		return 0
+
+	def poke(self, reg, val):
+		if reg == TBMCDev.wr_triggers:
+			for what in (TRIG.reset, TRIG.srq, TRIG.start, TRIG.stop, TRIG.auto):
+				if val & (1 << what):
+					self.trigger(what)
+		elif reg == TBMCDev.wr_cmd_buff:
+			if self.cmd_wr + 2 <= len(self.cmd_buff):
+				self.cmd_buff[self.cmd_wr:self.cmd_wr+2] = chr(val & 0xff) + chr((val >> 8) & 0xff)
+			self.cmd_wr += 2
+		else:
+			self.regs[reg] = val
+
+	def put(self, buff, off, data, sz):
+		"""Put data to the buffer padding it with zeroes up to the specified size"""
+		dst = ctypes.addressof(ctypes.c_char.from_buffer(buff, off))
+		ctypes.memmove(dst, str(data), len(data))
+		ctypes.memset(dst + len(data), 0, sz - len(data))
+
+	def read(self, reg, buff, off, cnt):
+		if reg != TBMCDev.rd_rx_buff:
+			for i in range(cnt):
+				ctypes.c_uint.from_buffer(buff, off + 4*i).value = self.peek(reg)
+			return
+		self.update()
+		if self.stream is not None and self.rx_avail() < 4 * cnt:
+			self.underrun = True
+		self.put(buff, off, self.rx_pop(4 * cnt), 4 * cnt)
+
+	def write(self, reg, buff, cnt):
+		for i in range(cnt):
+			self.poke(reg, ctypes.c_uint.from_buffer(buff, 4*i).value)
+
+	def write16(self, reg, buff, cnt):
+		if reg == TBMCDev.wr_cmd_buff:
+			sz = min(2 * cnt, len(self.cmd_buff) - self.cmd_wr)
+			self.cmd_buff[self.cmd_wr:self.cmd_wr+sz] = ctypes.string_at(buff, sz)
+			self.cmd_wr += 2 * cnt
+			return
+		for i in range(cnt):
+			self.poke(reg, ctypes.c_ushort.from_buffer(buff, 2*i).value)
+
+	def read16_ex(self, reg, buff, off, cnt, skipz):
+		self.update()
+		if skipz and not self.rx_avail():
+			return 0
+		sz = 4 * ((cnt + 1) // 2)
+		self.put(buff, off, self.rx_pop(sz), sz)
+		return sz // 2
+
+class TBMCSim(TBMCDev):
+	"""
+	The drop-in replacement of TBMCDev simulating the controller core along with T-modules connected.
+	The bus timing is simulated according to configuration. It may be scaled by time_scale parameter
+	(zero means no delays) and the latency parameter adds fixed delay to every bus transaction.
+	The optional applet parameter is the applet emulation routine (see tmod_sim.ts32_applet).
+	The first_module is the index of the first module in the sensor used for multi-controller setups.
+	"""
+	def __init__(self, channels = 8, chain = 4, time_scale = 1., latency = 0., applet = None, first_module = 0):
+		self.name, self.addr = TBMCDev.name, 0
+		self.io = SimIO(channels, chain, time_scale, latency, applet, first_module)
+		self.init()
+
+	def __str__(self):
+		return TBMCDev.__str__(self) + ' (simulated)'
+
+
+if __name__ == '__main__':
+	dev = TBMCSim()
+	print dev
@@ -7,10 +7,12 @@
 
 import struct
 import random
+import numpy as np
 import log
 import tbus_defs as tb
 import tmod_defs as tm
-from tbmc_dev import TBMCDev, TRIG, STATUS
+from tbmc_dev import TBMCDev, TRIG, STATUS, open_dev
+from aio import Return
 
 class TBUSCtl:
 	# Hard-coded parameters
@@ -26,6 +28,12 @@ class TBUSCtl:
 		self.chain = None
 		self.modules = None
 		self.mod_version = None
+		# The command headers (without cookie) cache indexed by (code, addr, data_len) tuple
+		self.cmd_templates = {}
+
+	def close(self):
+		"""Close the controller device"""
+		self.dev.close()
 
 	def bus_reset(self):
 		"""Issue hard reset on the bus"""
@@ -62,12 +70,12 @@ class TBUSCtl:
 				STATUS.ready | STATUS.tx_done | STATUS.data_rdy | STATUS.completed, STATUS.active,
 				tout=self.cfg.tbus_timeout
 			)
-		r = self.dev.rx_buff_read_all(len(poll_cmd) + 2, self.cfg.nchannels)
+		r = TBMCDev.rx_buff_array(*self.dev.rx_buff_read_all_(len(poll_cmd) + 2, self.cfg.nchannels))
 		assert len(r) == self.cfg.nchannels
+		rcnts = self._check_resp(poll_cmd, r)
 		chain, mod_version = None, None
 		for i, d in enumerate(r):
-			rcnt = self._check_resp(poll_cmd, d, i)
-			va, vb = struct.unpack('BB', d[tb.hdr_sz:tb.hdr_sz+2])
+			rcnt, va, vb = int(rcnts[i]), int(d[tb.hdr_sz]), int(d[tb.hdr_sz+1])
 			if va != vb:
 				raise RuntimeError('mixed module versions in channel #%d' % i)
 			log.dbg('    #%d: %d modules v.%x', i, rcnt, va)
@@ -94,97 +102,119 @@ class TBUSCtl:
 			return '%s uninitialized' % self.dev
 		return '%s %dx%d modules v.%x' % (self.dev, self.cfg.nchannels, self.chain, self.mod_version)
 
+	def _mk_hdr(self, cmd_code, addr, data_len):
+		"""Returns the cached T-BUS command header with zero cookie"""
+		key = (cmd_code, addr, data_len)
+		hdr = self.cmd_templates.get(key)
+		if hdr is None:
+			assert (data_len == 0) == ((cmd_code & tb.cmd_has_data_) == 0)
+			len1 = data_len - 1 if (cmd_code & tb.cmd_has_data_) else 0
+			assert 0 <= len1 and len1 < tb.max_data_length
+			hdr = self.cmd_templates[key] = tb.hdr_struct.pack(cmd_code, len1, addr, 0, 0, 0)
+		return hdr
+
 	def _mk_cmd(self, cmd_code, addr = 0, data = None, data_len = None):
 		"""Create and return T-BUS command"""
 		if data_len is None:
 			data_len = len(data) if data is not None else 0
-		assert (data_len == 0) == ((cmd_code & tb.cmd_has_data_) == 0)
-		len1 = data_len - 1 if (cmd_code & tb.cmd_has_data_) else 0
-		assert 0 <= len1 and len1 < tb.max_data_length
-		log.dbg('  BUS %-5s @%x %d bytes', tb.cmd_names[cmd_code], addr, data_len)
-		hdr = struct.pack(tb.hdr_fmt, cmd_code, len1, addr,
-			0 if self.cfg.skip_cmd_cookies else int(random.getrandbits(8)), 0, 0)
+		if log.level >= log.l_dbg:
+			log.dbg('  BUS %-5s @%x %d bytes', tb.cmd_names[cmd_code], addr, data_len)
+		hdr = self._mk_hdr(cmd_code, addr, data_len)
+		if not self.cfg.skip_cmd_cookies:
+			off = tb.hdr_cookie_off
+			hdr = hdr[:off] + chr(random.getrandbits(8)) + hdr[off+1:]
 		if data is None:
 			return hdr
 		else:
 			return hdr + data
 
 	@staticmethod
-	def _check_resp(req, resp, chan, check_data = False):
-		"""Check command response. Returns the number of responses."""
+	def _check_resp(req, resp, check_data = False):
+		"""
+		Check command responses from all channels given as 2D byte array (channel, byte).
+		Returns the array of the numbers of responses.
+		"""
 		# We expect response to have trailing idle bytes
-		assert len(resp) > len(req)
-		rcnt = TBUSCtl._check_resp_hdr(req, resp, chan)
-		if (check_data): TBUSCtl._check_resp_data(req, resp, chan)
-		TBUSCtl._check_resp_idle(resp, len(req), chan)
+		assert resp.shape[1] > len(req)
+		rcnt = TBUSCtl._check_resp_hdr(req, resp)
+		if (check_data): TBUSCtl._check_resp_data(req, resp)
+		TBUSCtl._check_resp_idle(resp, len(req))
 		return rcnt
 
 	@staticmethod
-	def _check_resp_hdr(req, resp, chan):
-		"""Check response header. Returns the number of responses."""
-		req_  = struct.unpack(tb.hdr_fmt, req[:tb.hdr_sz])
-		resp_ = struct.unpack(tb.hdr_fmt, resp[:tb.hdr_sz])
-		if req_[:4] != resp_[:4]:
+	def _check_resp_hdr(req, resp):
+		"""Check response headers. Returns the array of the numbers of responses."""
+		req_ = tb.hdr_struct.unpack_from(req)
+		hdr = np.ascontiguousarray(resp[:, :tb.hdr_sz]).view(tb.hdr_dtype)[:, 0]
+		bad = (hdr['code'] != req_[0]) | (hdr['len1'] != req_[1]) | (hdr['addr'] != req_[2]) | (hdr['cookie'] != req_[3])
+		if bad.any():
+			chan = int(bad.argmax())
 			raise RuntimeError('T-BUS %s returned unexpected header in channel %d: sent %s, received %s' % (
-					tb.cmd_names[req_[0]], chan, repr(req_), repr(resp_)
+					tb.cmd_names[req_[0]], chan, repr(req_), repr(hdr[chan].item())
 				))
-		if resp_[4]:
+		bad = hdr['status'] != 0
+		if bad.any():
+			chan = int(bad.argmax())
 			raise RuntimeError('T-BUS %s returned status %d in channel %d (%d responses)' % (
-					tb.cmd_names[req_[0]], resp_[4], chan, resp_[5]
+					tb.cmd_names[req_[0]], hdr['status'][chan], chan, hdr['r_cnt'][chan]
 				))
-		return resp_[5]
+		return hdr['r_cnt']
 
 	@staticmethod
-	def _check_resp_data(req, resp, chan):
+	def _check_resp_data(req, resp):
 		"""Compare data received with data sent."""
-		req_data, resp_data = req[tb.hdr_sz:], resp[tb.hdr_sz:len(req)]
-		if req_data != resp_data:
-			info, nerrs = 'no difference', 0
-			req_ = struct.unpack(tb.hdr_fmt, req[:tb.hdr_sz])
-			for i, req_b in enumerate(req_data):
-				if resp_data[i] != req_b:
-					if not nerrs:
-						info = '[%d] sent=0x%02x, recv=0x%02x' % (i, ord(req_b), ord(resp_data[i]))
-					nerrs += 1
-			info += ' (%d invalid bytes)' % nerrs
+		if len(req) <= tb.hdr_sz:
+			return
+		req_data = np.frombuffer(req, dtype=np.uint8, offset=tb.hdr_sz)
+		diff = resp[:, tb.hdr_sz:len(req)] != req_data
+		if diff.any():
+			chan = int(diff.any(axis=1).argmax())
+			pos = int(diff[chan].argmax())
+			info = '[%d] sent=0x%02x, recv=0x%02x (%d invalid bytes)' % (
+					pos, req_data[pos], resp[chan, tb.hdr_sz+pos], diff[chan].sum()
+				)
 			raise RuntimeError('T-BUS %s + %d bytes returned unexpected data in channel %d: %s' % (
-					tb.cmd_names[req_[0]], len(req), chan, info
+					tb.cmd_names[ord(req[0])], len(req), chan, info
 				))
 
 	@staticmethod
-	def _check_resp_idle(resp, req_len, chan):
-		"""Check trailing bytes of the response."""
-		for i in range(req_len, len(resp)):
-			if ord(resp[i]) != 0:
-				resp_ = struct.unpack(tb.hdr_fmt, resp[:tb.hdr_sz])
-				raise RuntimeError('T-BUS %s returned unexpected idle byte 0x%x in channel %d' % (
-						tb.cmd_names[resp_[0]], ord(resp[i]), chan
-					))
+	def _check_resp_idle(resp, req_len):
+		"""Check trailing bytes of the responses."""
+		idle = resp[:, req_len:]
+		if idle.any():
+			chan = int(idle.any(axis=1).argmax())
+			pos = int(idle[chan].nonzero()[0][0])
+			raise RuntimeError('T-BUS %s returned unexpected idle byte 0x%x in channel %d' % (
+					tb.cmd_names.get(int(resp[chan, 0]), '???'), idle[chan, pos], chan
+				))
+
+	def _check_resp_cnt(self, rcnt):
+		"""Check the numbers of responses returned by _check_resp / _check_resp_hdr"""
+		bad = rcnt != self.chain
+		if bad.any():
+			i = int(bad.argmax())
+			raise RuntimeError('unexpected number of responses in channel %d: expected %d, received %d' % (i, self.chain, rcnt[i]))
 
 	def _send_cmd(self, cmd_code, addr, data, check_data):
-		"""Send command and returns the array of responses"""
+		"""Send command and returns the responses as 2D byte array (channel, byte)"""
 		wait = (cmd_code==tb.cmd_wait)
 		cmd = self._mk_cmd(cmd_code, addr, data)
 		sz = len(cmd)
 		rx_len = sz + (sz & 1) + 2  # make it even and pad with zero bytes
 		tx_idle = (self.cfg.tbus_tx_idle, self.cfg.tbus_wt_idle)[wait]
 
-		self.dev.configure_freq(self.cfg.tbus_clk_div, tx_idle, self.cfg.tbus_turbo_idle)
-		self.dev.configure_tx(len(cmd), tx_fast = False, b16 = True)
-		self.dev.configure_rx(rx_len, skip = 4 * self.chain, wait = wait)
-
-		self.dev.cmd_put(cmd)
-		self.dev.trigger(TRIG.start)
+		self.dev.cmd_start(cmd,
+				TBMCDev.freq_ctl(self.cfg.tbus_clk_div, tx_idle, self.cfg.tbus_turbo_idle),
+				TBMCDev.tx_ctl(len(cmd), tx_fast = False, b16 = True),
+				TBMCDev.rx_ctl(rx_len, skip = 4 * self.chain, wait = wait)
+			)
 		self.dev.wait_status(
 				STATUS.ready | STATUS.tx_done | STATUS.data_rdy | STATUS.completed, STATUS.active,
 				tout=self.cfg.tbus_timeout
 			)
-		r = self.dev.rx_buff_read_all(rx_len, self.cfg.nchannels)
+		r = TBMCDev.rx_buff_array(*self.dev.rx_buff_read_all_(rx_len, self.cfg.nchannels))
 		assert len(r) == self.cfg.nchannels
-		for i, d in enumerate(r):
-			rcnt = self._check_resp(cmd, d, i, check_data)
-			if rcnt != self.chain:
-				raise RuntimeError('unexpected number of responses in channel %d: expected %d, received %d' % (i, self.chain, rcnt))
+		self._check_resp_cnt(self._check_resp(cmd, r, check_data))
 		return r
 
 	def bus_cmd(self, cmd_code, addr = 0, data = None):
@@ -209,6 +239,18 @@ class TBUSCtl:
 		Send read command. Raise exception if the command status is not success.
 		Returns buffer, slice list tuple.
 		"""
+		cmd, total_sz = self._bus_read_start(addr, data_len)
+		self.dev.wait_status(STATUS.data_rdy, 0, tout=self.cfg.tbus_timeout)
+		return self._bus_read_finish(cmd, total_sz)
+
+	def bus_read_async_(self, addr, data_len):
+		"""The coroutine version of bus_read_ (see aio)"""
+		cmd, total_sz = self._bus_read_start(addr, data_len)
+		yield self.dev.wait_status_async(STATUS.data_rdy, 0, tout=self.cfg.tbus_timeout)
+		raise Return(self._bus_read_finish(cmd, total_sz))
+
+	def _bus_read_start(self, addr, data_len):
+		"""Start read command transmission. Returns the command, total response size tuple."""
 		assert data_len > 0
 		assert (data_len & 1) == 0
 		total_sz = tb.hdr_sz + data_len * self.chain
@@ -218,19 +260,17 @@ class TBUSCtl:
 		cmd = self._mk_cmd(tb.cmd_read, addr, None, data_len)
 		assert len(cmd) == tb.hdr_sz
 
-		self.dev.configure_freq(self.cfg.tbus_clk_div, self.cfg.tbus_tx_idle, self.cfg.tbus_turbo_idle)
-		self.dev.configure_tx(len(cmd), tx_fast = True, b16 = True)
-		self.dev.configure_rx(total_sz, skip = 4 * self.chain)
-
-		self.dev.cmd_put(cmd)
-		self.dev.trigger(TRIG.start)
-		self.dev.wait_status(STATUS.data_rdy, 0, tout=self.cfg.tbus_timeout)
+		self.dev.cmd_start(cmd,
+				TBMCDev.freq_ctl(self.cfg.tbus_clk_div, self.cfg.tbus_tx_idle, self.cfg.tbus_turbo_idle),
+				TBMCDev.tx_ctl(len(cmd), tx_fast = True, b16 = True),
+				TBMCDev.rx_ctl(total_sz, skip = 4 * self.chain)
+			)
+		return cmd, total_sz
 
+	def _bus_read_finish(self, cmd, total_sz):
+		"""Read and check the read command responses. Returns buffer, slice list tuple."""
 		buff, ranges = self.dev.rx_buff_read_all_(total_sz, self.cfg.nchannels)
-		for i, r in enumerate(ranges):
-			rcnt = self._check_resp_hdr(cmd, buff[r.start:r.start+tb.hdr_sz], i)
-			if rcnt != self.chain:
-				raise RuntimeError('unexpected number of responses in channel %d: expected %d, received %d' % (i, self.chain, rcnt))
+		self._check_resp_cnt(self._check_resp_hdr(cmd, TBMCDev.rx_buff_array(buff, ranges)))
 
 		return buff, [slice(r.start + tb.hdr_sz, r.stop) for r in ranges]
 
@@ -246,6 +286,14 @@ class TBUSCtl:
 		buff, ranges = self.dev.rx_buff_read_all_on_ready_(total_sz, self.cfg.nchannels, tout=self.cfg.tbus_timeout, idle_cb=idle_cb)
 		return buff, [slice(r.start + tb.hdr_sz, r.stop) for r in ranges]
 
+	def bus_read_auto_async_(self, data_len):
+		"""The coroutine version of bus_read_auto_ (see aio)"""
+		assert data_len > 0
+		assert (data_len & 1) == 0
+		total_sz = tb.hdr_sz + data_len * self.chain
+		buff, ranges = yield self.dev.rx_buff_read_all_on_ready_async(total_sz, self.cfg.nchannels, tout=self.cfg.tbus_timeout)
+		raise Return((buff, [slice(r.start + tb.hdr_sz, r.stop) for r in ranges]))
+
 	def bus_read_raw(self, addr, data_len):
 		"""
 		Send read command. Raise exception if the command status is not success.
@@ -260,29 +308,78 @@ class TBUSCtl:
 		data = self.bus_read_raw(addr, data_len_)
 		return [data[i*data_len_:i*data_len_+data_len] for i in range(self.modules)]
 
+	def bus_read_async(self, addr, data_len):
+		"""The coroutine version of bus_read (see aio)"""
+		data_len_ = data_len + (data_len & 1)
+		buff, ranges = yield self.bus_read_async_(addr, data_len_)
+		data = ''.join([buff[r] for r in ranges])
+		raise Return([data[i*data_len_:i*data_len_+data_len] for i in range(self.modules)])
+
 	def bus_read_struct(self, addr, fmt):
 		"""
 		Read data from the specified address and parse it according to specified format.
-		Returns the array of the data tuples.
+		Returns the array of the data tuples. If the format is numpy (structured) type
+		returns numpy array instead (see bus_read_array).
 		"""
+		if isinstance(fmt, np.dtype):
+			return self.bus_read_array(addr, fmt)
 		data = self.bus_read(addr, struct.calcsize(fmt))
 		return [struct.unpack(fmt, d) for d in data]
 
+	def bus_read_view_(self, addr, dtype):
+		"""
+		Read data of the given numpy type from the specified address. Returns (channels, chain) + dtype.shape
+		read-only array viewing the receive buffer directly. The view remains valid until the receive buffer
+		is reused by subsequent bus operations (see TBMCDev.rx_pool_size).
+		"""
+		dtype = np.dtype(dtype)
+		data_len = dtype.itemsize + (dtype.itemsize & 1)
+		buff, ranges = self.bus_read_(addr, data_len)
+		stride = ranges[1].start - ranges[0].start if len(ranges) > 1 else data_len * self.chain
+		shape, strides = (len(ranges), self.chain), (stride, data_len)
+		if dtype.subdtype is not None:
+			dtype, sub_shape = dtype.subdtype
+			shape += sub_shape
+			strides += tuple(np.empty(sub_shape, dtype=dtype).strides)
+		v = np.ndarray(shape, dtype=dtype, buffer=buff, offset=ranges[0].start, strides=strides)
+		v.flags.writeable = False
+		return v
+
+	def bus_read_array(self, addr, dtype, out = None):
+		"""
+		Read data of the given numpy type from the specified address. The type may be structured or
+		subarray type like (np.int16, 35). Returns (modules,) + dtype.shape array copied from the receive
+		buffer by single strided copy skipping the channel headers. The caller may provide contiguous
+		array to put the data to.
+		"""
+		v = self.bus_read_view_(addr, dtype)
+		if out is None:
+			out = np.empty((self.modules,) + v.shape[2:], dtype=v.dtype)
+		elif not out.flags.c_contiguous:
+			raise ValueError('the output array is not contiguous')
+		np.copyto(out.reshape(v.shape), v)
+		return out
+
+	def _coherent_data(self, r, data_len):
+		"""
+		Extract coherent data from the poll command responses. Raise exception if
+		the data is not coherent. Returns (r_cnt, data) tuple.
+		"""
+		resp = r[:, tb.hdr_sz:tb.hdr_sz+2*data_len]
+		r_or, r_and = resp[:, ::2], resp[:, 1::2]
+		bad = (r_or != r_and).any(axis=1) | (r_or != r_or[0]).any(axis=1)
+		if bad.any():
+			raise RuntimeError('data is not coherent in channel %d' % bad.argmax())
+
+		return (self.modules, r_or[0].tobytes())
+
 	def bus_read_coherent(self, addr, data_len):
 		"""
 		Read coherent data from the specified address. Raise exception if the command status
 		is not success or the data is not coherent. Returns (r_cnt, data) tuple.
 		"""
-		data, buff = '\x00\xff' * data_len, None
-		r = self._send_cmd(tb.cmd_poll, addr, data, False)
-		for i, d in enumerate(r):
-			resp = d[tb.hdr_sz:tb.hdr_sz+len(data)]
-			r_or, r_and = resp[::2], resp[1::2]
-			if buff is None: buff = r_or
-			if r_or != r_and or r_or != buff:
-				raise RuntimeError('data is not coherent in channel %d' % i)
-
-		return (self.modules, buff)
+		r = self._send_cmd(tb.cmd_poll, addr, '\x00\xff' * data_len, False)
+		return self._coherent_data(r, data_len)
 
 	def bus_read_struct_coherent(self, addr, fmt):
 		"""
@@ -292,13 +389,118 @@ class TBUSCtl:
 		r_cnt, data = self.bus_read_coherent(addr, struct.calcsize(fmt))
 		return (r_cnt, struct.unpack(fmt, data))
 
+	def batch(self):
+		"""Create the batch of commands to be sent in single transmission (see TBUSBatch)"""
+		return TBUSBatch(self)
+
+class TBUSBatch:
+	"""
+	The batch of T-BUS commands sent in single transmission. The commands are added by write, wait,
+	read, read_coherent, read_struct_coherent methods and sent by execute. The responses are checked
+	the same way as the responses to individual commands. The total command length is limited by
+	the command buffer size and the total response length is limited by the receive buffer size.
+	The commands are sent back to back. The odd sized command (the write of odd sized data) may only
+	be the last one since the 16 bit transmitter follows it by zero byte the same way as the individual
+	command. Putting the idle byte between commands is not known to be accepted by the modules.
+	The wait command may only be the first one since the receiver skips the idle bytes sent by
+	the busy modules only before the first response. The idle bytes in the middle of the response
+	would shift the responses of the subsequent commands.
+	"""
+	def __init__(self, ctl):
+		self.ctl = ctl
+		self.cmds = []
+		self.cmd_len = 0
+		self.resp_len = 0
+		self.wait_ = False
+
+	def add_(self, cmd_code, addr, data, data_len, check_data, parse):
+		"""
+		Add command to the batch given the flag requesting data check and the routine making the result
+		from the 2D array of channel responses or None if the command does not return anything.
+		"""
+		ctl = self.ctl
+		cmd = ctl._mk_cmd(cmd_code, addr, data, data_len)
+		resp_len = len(cmd) if cmd_code != tb.cmd_read else tb.hdr_sz + data_len * ctl.chain
+		if self.cmd_len & 1:
+			raise RuntimeError('T-BUS odd sized command may only be the last one in batch')
+		if cmd_code == tb.cmd_wait and self.cmds:
+			raise RuntimeError('T-BUS wait command may only be the first one in batch')
+		if self.cmd_len + len(cmd) > TBMCDev.max_cmd_length:
+			raise RuntimeError('T-BUS batch length exceeds %d bytes' % TBMCDev.max_cmd_length)
+		# Reserve room for trailing idle bytes
+		sz = self.resp_len + resp_len
+		if sz + (sz & 1) + 2 > TBMCDev.max_rx_length:
+			raise RuntimeError('T-BUS batch response length exceeds %d bytes' % TBMCDev.max_rx_length)
+		self.cmds.append((cmd, self.resp_len, resp_len, check_data, parse))
+		self.cmd_len += len(cmd)
+		self.resp_len = sz
+		if cmd_code == tb.cmd_wait:
+			self.wait_ = True
+
+	def write(self, addr, data):
+		"""Add write command"""
+		self.add_(tb.cmd_write, addr, data, None, True, None)
+
+	def wait(self):
+		"""Add wait command. It must be the first command in the batch."""
+		self.add_(tb.cmd_wait, 0, None, None, False, None)
+
+	def read(self, addr, data_len):
+		"""Add read command. The result is the array of the data responses (see TBUSCtl.bus_read)."""
+		ctl, data_len_ = self.ctl, data_len + (data_len & 1)
+		def parse(r):
+			data = r[:, tb.hdr_sz:].tobytes()
+			return [data[i*data_len_:i*data_len_+data_len] for i in range(ctl.modules)]
+		self.add_(tb.cmd_read, addr, None, data_len_, False, parse)
+
+	def read_coherent(self, addr, data_len):
+		"""Add coherent read command. The result is (r_cnt, data) tuple (see TBUSCtl.bus_read_coherent)."""
+		self.add_(tb.cmd_poll, addr, '\x00\xff' * data_len, None, False,
+			lambda r: self.ctl._coherent_data(r, data_len))
+
+	def read_struct_coherent(self, addr, fmt):
+		"""Add coherent read command. The result is (r_cnt, data_tuple) tuple (see TBUSCtl.bus_read_struct_coherent)."""
+		def parse(r):
+			r_cnt, data = self.ctl._coherent_data(r, struct.calcsize(fmt))
+			return (r_cnt, struct.unpack(fmt, data))
+		self.add_(tb.cmd_poll, addr, '\x00\xff' * struct.calcsize(fmt), None, False, parse)
+
+	def execute(self):
+		"""Send all commands and check responses. Returns the list of command results."""
+		assert self.cmds
+		ctl, dev, cfg = self.ctl, self.ctl.dev, self.ctl.cfg
+		cmd = ''.join([c[0] for c in self.cmds])
+		rx_len = self.resp_len + (self.resp_len & 1) + 2  # make it even and pad with zero bytes
+		tx_idle = (cfg.tbus_tx_idle, cfg.tbus_wt_idle)[self.wait_]
+
+		dev.cmd_start(cmd,
+				TBMCDev.freq_ctl(cfg.tbus_clk_div, tx_idle, cfg.tbus_turbo_idle),
+				TBMCDev.tx_ctl(len(cmd), tx_fast = False, b16 = True),
+				TBMCDev.rx_ctl(rx_len, skip = 4 * ctl.chain, wait = self.wait_)
+			)
+		dev.wait_status(
+				STATUS.ready | STATUS.tx_done | STATUS.data_rdy | STATUS.completed, STATUS.active,
+				tout=cfg.tbus_timeout
+			)
+		r = TBMCDev.rx_buff_array(*dev.rx_buff_read_all_(rx_len, cfg.nchannels))
+		assert len(r) == cfg.nchannels
+		res = []
+		for req, off, sz, check_data, parse in self.cmds:
+			resp = r[:, off:off+sz]
+			ctl._check_resp_cnt(ctl._check_resp_hdr(req, resp))
+			if check_data:
+				ctl._check_resp_data(req, resp)
+			res.append(parse(resp) if parse is not None else None)
+		ctl._check_resp_idle(r, self.resp_len)
+		return res
+
 
 if __name__ == '__main__':
 	import sys
 	from config import tbus_conf as conf
 	if '-v' in sys.argv:
 		log.level = log.l_trc
-	dev = TBMCDev()
+	dev = open_dev(conf)
 	ctl = TBUSCtl(dev, conf)
 	ctl.bus_init()
 	print ctl
@@ -6,6 +6,7 @@
 # Author: Oleg Volkov olegv142@gmail.com
 
 import struct
+import numpy as np
 
 # Command flags
 cmd_has_data_      = 8
@@ -33,6 +34,13 @@ cmd_names = {
 # Command header format
 hdr_fmt = 'BBHBBH'
 hdr_sz  = struct.calcsize(hdr_fmt)
+hdr_struct = struct.Struct(hdr_fmt)
+# The offset of the cookie byte in the header
+hdr_cookie_off = 4
+# The header as numpy structured type
+hdr_dtype = np.dtype([
+		('code', np.uint8), ('len1', np.uint8), ('addr', np.uint16), ('cookie', np.uint8), ('status', np.uint8), ('r_cnt', np.uint16)
+	])
 
 # Data length encoding
 data_length_bits = 8
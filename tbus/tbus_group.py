@@ -0,0 +1,132 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The group of T-BUS controllers acting as single sensor
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+import threading
+import Queue
+import numpy as np
+import log
+from tbus_ctl import TBUSCtl
+from tbmc_dev import open_devs
+
+class Worker:
+	"""The thread executing calls on behalf of the group"""
+	def __init__(self, name):
+		self.req = Queue.Queue()
+		self.res = Queue.Queue()
+		self.thread = threading.Thread(target=self.run, name=name)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self):
+		while True:
+			req = self.req.get()
+			if req is None:
+				break
+			fn, args = req
+			try:
+				self.res.put((fn(*args), None))
+			except:
+				self.res.put((None, sys.exc_info()))
+
+	def submit(self, fn, *args):
+		self.req.put((fn, args))
+
+	def result(self):
+		"""Wait the result of the submitted call. Re-raise exception if any."""
+		r, exc = self.res.get()
+		if exc is not None:
+			raise exc[0], exc[1], exc[2]
+		return r
+
+	def stop(self):
+		self.req.put(None)
+		self.thread.join()
+
+class TBUSGroup:
+	"""
+	The group of T-BUS controllers acting as single sensor. The operations are executed
+	on all controllers concurrently, every controller except the first one has its own worker thread.
+	The modules are numbered in the order of controllers so the data frames acquired by
+	individual controllers are concatenated to get the sensor frame.
+	"""
+	def __init__(self, ctls):
+		"""Create group given the list of TBUSCtl instances"""
+		assert ctls
+		self.ctls = ctls
+		self.cfg = ctls[0].cfg
+		self.workers = [Worker('tbus#%d' % i) for i in range(1, len(ctls))]
+		self.modules = None
+
+	def map(self, fn, *args):
+		"""
+		Call fn(ctl, *args) for all controllers concurrently.
+		Returns the list of results in the order of controllers.
+		"""
+		for w, ctl in zip(self.workers, self.ctls[1:]):
+			w.submit(fn, ctl, *args)
+		res, exc = [], None
+		try:
+			res.append(fn(self.ctls[0], *args))
+		except:
+			exc = sys.exc_info()
+		# Always collect results so the workers are ready for the next call
+		for w in self.workers:
+			try:
+				res.append(w.result())
+			except:
+				if exc is None:
+					exc = sys.exc_info()
+		if exc is not None:
+			raise exc[0], exc[1], exc[2]
+		return res
+
+	def bus_init(self):
+		"""Initialize all controllers"""
+		self.map(TBUSCtl.bus_init)
+		if len(set([ctl.mod_version for ctl in self.ctls])) != 1:
+			raise RuntimeError('mixed module versions in controllers group')
+		self.modules = sum([ctl.modules for ctl in self.ctls])
+		self.mod_version = self.ctls[0].mod_version
+
+	def bus_read_array(self, addr, dtype, out = None):
+		"""
+		Read data of the given numpy type from all controllers (see TBUSCtl.bus_read_array).
+		Every controller puts its data to its own part of the output array.
+		"""
+		dtype = np.dtype(dtype)
+		if out is None:
+			out = np.empty((self.modules,) + dtype.shape, dtype=dtype.base)
+		parts = dict(zip(self.ctls, self.split(out)))
+		self.map(lambda ctl: ctl.bus_read_array(addr, dtype, parts[ctl]))
+		return out
+
+	def split(self, out):
+		"""Returns the list of views of the array parts holding the data of every controller's modules"""
+		return np.split(out, np.cumsum([ctl.modules for ctl in self.ctls])[:-1])
+
+	def close(self):
+		"""Stop worker threads and close all controllers"""
+		for w in self.workers:
+			w.stop()
+		self.workers = []
+		for ctl in self.ctls:
+			ctl.close()
+
+	def __str__(self):
+		return ', '.join([str(ctl) for ctl in self.ctls])
+
+def open_ctl(cfg):
+	"""
+	Open all controllers according to configuration. Returns TBUSCtl instance if there is
+	single controller or TBUSGroup otherwise.
+	"""
+	devs = open_devs(cfg)
+	log.dbg('%d controller(s) found', len(devs))
+	if len(devs) == 1:
+		return TBUSCtl(devs[0], cfg)
+	return TBUSGroup([TBUSCtl(dev, cfg) for dev in devs])
@@ -0,0 +1,73 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The background acquisition service test running against the simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+sys.path.append('..')
+import config.tbus_conf as conf
+import config.ts32_conf as applet_conf
+import ts32
+import pixels
+from acq_service import AcqService, Subscriber
+from tbus_group import open_ctl
+
+conf.simulate = True
+conf.sim_time_scale = 0.
+conf.sim_controllers = 2
+
+def test_frames():
+	srv = AcqService(open_ctl(conf), applet_conf, pixels.get_image_pixels)
+	srv.start()
+	s1 = srv.subscribe(4)
+	s2 = srv.subscribe(1, Subscriber.drop_newest)
+	last = None
+	for i in range(10):
+		seq, (raw, pixs) = s1.get(1.)
+		assert last is None or seq > last
+		assert (pixs == pixels.get_image_pixels(raw)).all()
+		last = seq
+	# The slow subscriber does not stall the others
+	assert s2.get(1.) is not None
+	seq, arrays = srv.latest()
+	assert seq >= last and arrays[0].flags.writeable
+	# The queued frames are still available after unsubscribe but no new ones come
+	srv.unsubscribe(s1)
+	while s1.get() is not None:
+		pass
+	# The subscribers are woken up on stop
+	srv.stop()
+	while s2.get() is not None:
+		pass
+	assert srv.error is None and not srv.running
+
+def test_error():
+	srv = AcqService(open_ctl(conf), applet_conf)
+	srv.start()
+	s = srv.subscribe()
+	acquire_auto = ts32.acquire_auto
+	def acquire_failed(*args, **kwargs):
+		raise RuntimeError('simulated failure')
+	ts32.acquire_auto = acquire_failed
+	try:
+		while True:
+			s.get()
+	except RuntimeError as e:
+		assert 'simulated failure' in str(e)
+	finally:
+		ts32.acquire_auto = acquire_auto
+	assert not srv.running and srv.error is not None
+	srv.stop()
+
+def main():
+	test_frames()
+	test_error()
+	print 'acquisition service: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
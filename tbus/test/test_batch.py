@@ -0,0 +1,59 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The T-BUS batched commands test running against the simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+sys.path.append('..')
+import config.tbus_conf as conf
+import tmod_defs as tm
+from tbus_group import open_ctl
+
+conf.simulate = True
+conf.sim_time_scale = 0.
+
+def expect_error(fn, *args):
+	try:
+		fn(*args)
+	except RuntimeError:
+		return
+	assert False, '%s accepted' % fn.__name__
+
+def main():
+	ctl = open_ctl(conf)
+	ctl.bus_init()
+
+	b = ctl.batch()
+	b.wait()
+	b.write(tm.srq_buff_addr + 8, '0123456789')
+	b.read(tm.srq_buff_addr + 8, 5)
+	b.read_struct_coherent(tm.status_addr, 'BBBBI')
+	b.read_coherent(tm.srq_buff_addr + 8, 4)
+	b.write(tm.srq_buff_addr, 'abcde')
+	r = b.execute()
+	assert r[0] is None and r[1] is None
+	assert r[2] == ['01234'] * ctl.modules
+	assert r[3] == ctl.bus_read_struct_coherent(tm.status_addr, 'BBBBI')
+	assert r[4] == (ctl.modules, '0123')
+	assert r[5] is None
+	assert ctl.bus_read(tm.srq_buff_addr, 5) == ['abcde'] * ctl.modules
+
+	# The wait must be the first command
+	b = ctl.batch()
+	b.read(tm.status_addr, 2)
+	expect_error(b.wait)
+
+	# The odd sized write must be the last one
+	b = ctl.batch()
+	b.write(tm.srq_buff_addr, 'abc')
+	expect_error(b.read, tm.status_addr, 2)
+
+	print 'batch: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
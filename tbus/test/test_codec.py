@@ -0,0 +1,49 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The frame encoder / decoder round trip test
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+import numpy as np
+sys.path.append('..')
+from frame_codec import FrameEncoder, FrameDecoder
+
+def test_codec(frames, mode, level, quant):
+	enc, dec = FrameEncoder(mode, 10, level, quant), FrameDecoder()
+	sizes = []
+	prefix = lambda sz: sizes.append(sz) or 'PFX'
+	for i, f in enumerate(frames):
+		msg = enc.encode(i, f, prefix if i & 1 else None).tobytes()
+		if i & 1:
+			assert msg[:3] == 'PFX' and len(msg) == 3 + sizes[-1]
+			msg = msg[3:]
+		seq, d = dec.decode(msg)
+		assert seq == i and d.shape == f.shape
+		if quant:
+			assert np.abs(d - f).max() <= 6000 / 255. + 1
+		else:
+			assert (d == f).all()
+
+def main():
+	frames = [np.random.randint(-3000, 3000, (24, 32)).astype(np.int16)]
+	for i in range(39):
+		frames.append((frames[-1] + np.random.randint(-3, 4, frames[-1].shape)).astype(np.int16))
+	for mode in FrameEncoder.modes.values():
+		for level in (0, 6):
+			for quant in (False, True):
+				test_codec(frames, mode, level, quant)
+	for bad in ((5, 30, 0), (0, 0, 0), (0, 30, 10)):
+		try:
+			FrameEncoder(*bad)
+			assert False, 'invalid encoder parameters accepted'
+		except ValueError:
+			pass
+	print 'frame codec: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The temporal filters test
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+sys.path.append('..')
+import numpy as np
+from filters import EMAFilter, BoxcarFilter, MinMaxFilter, make_filter
+from acq_service import Subscriber
+
+shape = (4, 5)
+
+class Service:
+	"""The minimal service the subscriber needs"""
+	layout = [(shape, np.int16)]
+	error = None
+
+def expect_error(spec):
+	try:
+		make_filter(spec)
+	except ValueError:
+		return
+	assert False, '%r accepted' % spec
+
+def test_filters(frames):
+	ema, box, mm = EMAFilter(.25), BoxcarFilter(3), MinMaxFilter('range')
+	ref = frames[0].astype(np.float64)
+	for i, f in enumerate(frames):
+		if i:
+			ref += .25 * (f - ref)
+		assert np.allclose(ema.update(f), ref, atol=1e-3)
+		assert np.allclose(box.update(f), frames[max(0, i - 2):i + 1].mean(axis=0))
+		r = mm.update(f)
+		assert r.dtype == f.dtype
+		assert (r == frames[:i + 1].max(axis=0) - frames[:i + 1].min(axis=0)).all()
+	# The accumulators are dropped by reset
+	box.reset()
+	assert (box.update(frames[-1]) == frames[-1]).all()
+
+def test_make_filter():
+	assert make_filter('') is None
+	assert isinstance(make_filter('ema:0.5'), EMAFilter)
+	assert make_filter('box:8').n == 8
+	for m in MinMaxFilter.modes:
+		assert make_filter(m).mode == m
+	for spec in ('ema', 'ema:0', 'ema:2', 'ema:x', 'box:0', 'box:1.5', 'max:1', 'median'):
+		expect_error(spec)
+
+def test_subscriber(frames):
+	s = Subscriber(Service(), len(frames), Subscriber.drop_oldest, make_filter('max'))
+	for seq, f in enumerate(frames):
+		s.publish(seq, [f])
+	for seq in range(len(frames)):
+		r, arrays = s.get(0)
+		assert r == seq and (arrays[0] == frames[:seq + 1].max(axis=0)).all()
+	# No filtering after the filter is removed
+	s.set_filter(None)
+	s.publish(seq + 1, [frames[0]])
+	r, arrays = s.get(0)
+	assert (arrays[0] == frames[0]).all()
+
+def main():
+	frames = np.random.randint(-1000, 1000, (10,) + shape).astype(np.int16)
+	test_filters(frames)
+	test_make_filter()
+	test_subscriber(frames)
+	print 'filters: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
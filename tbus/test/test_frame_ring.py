@@ -0,0 +1,121 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The frame ring test including auto mode acquisition against the simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+import threading
+import numpy as np
+sys.path.append('..')
+import config.tbus_conf as conf
+import config.ts32_conf as applet_conf
+import ts32
+import pixels
+from frame_ring import FrameRing
+from tbus_group import open_ctl
+
+conf.simulate = True
+conf.sim_time_scale = 0.
+
+layout = [((2, 3), np.int16), ((4,), np.float32)]
+
+def put(ring, val, tout = None):
+	for a in ring.put():
+		a[...] = val
+	return ring.commit(tout)
+
+def check(r, seq):
+	assert r is not None and r[0] == seq, r
+	for a in r[1]:
+		assert (a == seq).all() and not a.flags.writeable
+
+def test_drop_oldest():
+	ring = FrameRing(3, layout)
+	for i in range(5):
+		assert put(ring, i) == i
+	assert ring.pending() == 3
+	# The oldest frames are overwritten
+	for i in range(2, 5):
+		check(ring.get(0), i)
+	assert ring.get(0) is None
+	# The frame held by the consumer is never overwritten
+	put(ring, 5)
+	r = ring.get(0)
+	for i in range(6, 12):
+		put(ring, i)
+	check(r, 5)
+	assert ring.stats() == {'frames': 12, 'pending': 3, 'overwritten': 5, 'dropped': 0}
+
+def test_block():
+	ring = FrameRing(2, layout, FrameRing.block)
+	assert put(ring, 0) == 0 and put(ring, 1) == 1
+	# The new frame is dropped on timeout
+	assert put(ring, 2, 0) is None
+	assert ring.stats()['dropped'] == 1
+	# The producer waits the consumer
+	got = []
+	def consume():
+		got.append(ring.get(1.)[0])
+		ring.release()
+	t = threading.Thread(target=consume)
+	t.start()
+	assert put(ring, 2, 1.) == 2
+	t.join()
+	assert got == [0]
+	check(ring.get(0), 1)
+	check(ring.get(0), 2)
+	# The closed ring does not wait
+	ring.close()
+	assert ring.get() is None
+
+def test_single_consumer():
+	ring = FrameRing(2, layout)
+	put(ring, 0)
+	put(ring, 1)
+	check(ring.get(0), 0)
+	errors = []
+	def consume():
+		try:
+			ring.get(0)
+		except RuntimeError:
+			errors.append(True)
+	t = threading.Thread(target=consume)
+	t.start()
+	t.join()
+	assert errors
+	# Another thread may consume after the frame is released
+	ring.release()
+	got = []
+	t = threading.Thread(target=lambda: got.append(ring.get(0)[0]))
+	t.start()
+	t.join()
+	assert got == [1]
+
+def test_acquire():
+	ctl = open_ctl(conf)
+	ctl.bus_init()
+	ts32.configure(ctl, applet_conf)
+	data = ts32.acquire(ctl, applet_conf)
+	ts32.run_auto(ctl)
+	ring = ts32.frame_ring(ctl, 2, convert=pixels.get_image_pixels)
+	for i in range(3):
+		assert ts32.acquire_auto_ring(ctl, ring, convert=pixels.get_image_pixels) == i
+	seq, (raw, pixs) = ring.get(0)
+	assert seq == 1 and raw.shape == data.shape
+	assert (pixs == pixels.get_image_pixels(raw)).all()
+	ctl.close()
+
+def main():
+	test_drop_oldest()
+	test_block()
+	test_single_consumer()
+	test_acquire()
+	print 'frame ring: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The numpy based memory mapped IO backend test over the anonymous memory map
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+import mmap
+import numpy as np
+sys.path.append('..')
+import mmio
+
+reg = 5
+
+class Fifo:
+	"""
+	The register returning the given leading words one by one and then the array value.
+	The memory is not FIFO so the leading zeros skipping is checked by replacing the registers array.
+	"""
+	def __init__(self, regs, leading):
+		self.regs = regs
+		self.leading = list(leading)
+
+	def __getitem__(self, i):
+		if self.leading:
+			return self.leading.pop(0)
+		return self.regs[i]
+
+	def __array__(self, dtype = None):
+		return self.regs
+
+def test_access(io):
+	io.poke(reg, 0x12345678)
+	assert io.peek(reg) == 0x12345678 and io.peek(reg - 1) == 0
+	buff = bytearray(32)
+	io.read(reg, buff, 8, 4)
+	assert np.frombuffer(buff, dtype=np.uint32).tolist() == [0, 0] + [0x12345678] * 4 + [0, 0]
+	# Every word is written to the same register so the last one remains there
+	io.write(reg, np.array([1, 2, 3], dtype=np.uint32), 3)
+	assert io.peek(reg) == 3
+	io.write16(reg, np.array([0xffff, 0x8001], dtype=np.uint16), 2)
+	assert io.peek(reg) == 0x8001
+	assert io.peek(reg + 1) == 0
+
+def test_read16(io):
+	buff = bytearray(16)
+	out = np.frombuffer(buff, dtype=np.uint16)
+	io.poke(reg, 0x00020001)
+	assert io.read16_ex(reg, buff, 2, 4, 0) == 4
+	assert out[1:5].tolist() == [1, 2, 1, 2] and out[0] == 0
+	# The odd count may be rounded up to the whole word
+	assert io.read16_ex(reg, buff, 0, 3, 0) == 4
+	# The leading zero words are skipped
+	regs = io.regs
+	io.regs = Fifo(regs, [0, 0])
+	assert io.read16_ex(reg, buff, 0, 4, 8) == 4
+	assert out[:4].tolist() == [1, 2, 1, 2]
+	# The zero low half of the first nonzero word is skipped as well
+	io.regs = Fifo(regs, [0, 0x00070000])
+	assert io.read16_ex(reg, buff, 0, 4, 8) == 5
+	assert out[:5].tolist() == [7, 1, 2, 1, 2]
+	# Nothing is read if all words are zero
+	io.regs = Fifo(regs, [0] * 3)
+	assert io.read16_ex(reg, buff, 0, 4, 3) == 0
+	io.regs = regs
+
+def main():
+	m = mmap.mmap(-1, mmap.PAGESIZE)
+	mmio.backend = 'np'
+	io = mmio.open_io(m, reg)
+	assert isinstance(io, mmio.NpIO)
+	test_access(io)
+	test_read16(io)
+	print 'numpy mmio backend: ok'
+	if mmio.libmmio is not None:
+		test_access(mmio.LibIO(m))
+		print 'libmmio backend: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The data to image conversion and calibration tests comparing them with the per-pixel reference
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import os
+import sys
+import tempfile
+import numpy as np
+sys.path.append('..')
+import config.pix_conf as pconf
+import pixels
+
+nchannels = 35
+
+def reference_map(nmodules):
+	"""Build pixel map by resolving every pixel individually"""
+	h, w = (nmodules / pconf.modules_in_row) * pconf.mod_h, pconf.modules_in_row * pconf.mod_w
+	m_ind, c_ind = np.empty((h, w), dtype=int), np.empty((h, w), dtype=int)
+	for r in range(h):
+		for c in range(w):
+			m_ind[r, c], (mr, mc) = pconf.mod_resolver(r, c, nmodules)
+			c_ind[r, c] = pconf.mod_pixels[r - mr][c - mc]
+	if pconf.image_fliplr:
+		m_ind, c_ind = np.fliplr(m_ind), np.fliplr(c_ind)
+	if pconf.image_flipud:
+		m_ind, c_ind = np.flipud(m_ind), np.flipud(c_ind)
+	if pconf.image_transpose:
+		m_ind, c_ind = np.transpose(m_ind), np.transpose(c_ind)
+	return m_ind, c_ind
+
+def test_map(nmodules):
+	m_ref, c_ref = reference_map(nmodules)
+	m_ind, c_ind, f_ind = pixels.get_pixels_map(nmodules, nchannels)
+	assert (m_ind == m_ref).all() and (c_ind == c_ref).all()
+	assert (f_ind == m_ref * nchannels + c_ref).all()
+	data = np.random.randint(-1000, 1000, (nmodules, nchannels)).astype(np.int16)
+	pixs = pixels.get_image_pixels(data)
+	assert pixs.dtype == data.dtype and (pixs == -data[m_ref, c_ref]).all()
+	out = np.zeros(pixs.shape, dtype=np.int16)
+	assert pixels.get_image_pixels(data, out) is out and (out == pixs).all()
+	# The custom channel routine gives the same image
+	pconf.channel_data = lambda d, m, c: -d[m, c]
+	try:
+		assert (pixels.get_image_pixels(data) == pixs).all()
+	finally:
+		pconf.channel_data = None
+
+def scalar_resolver(r, c, nmodules):
+	"""The resolver accepting scalars only"""
+	if not isinstance(r, (int, long, np.integer)):
+		raise TypeError('scalar expected')
+	i, j = r // pconf.mod_h, c // pconf.mod_w
+	return (nmodules - 1) - (i * pconf.modules_in_row + j), (i * pconf.mod_h, j * pconf.mod_w)
+
+def reference_calibration(cal, data):
+	"""Calibrate data frame pixel by pixel"""
+	ref = data[:, list(pconf.calib_ref_channels)].mean(axis=1, keepdims=True)
+	res = (data - ref - cal.offset) * cal.gain
+	out = res.copy()
+	f_ind = pixels.get_pixels_map(*data.shape)[2]
+	h, w = f_ind.shape
+	for r, c in zip(*np.nonzero(cal.bad.reshape(-1)[f_ind])):
+		nbrs = [f_ind[r + dr, c + dc] for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))
+			if 0 <= r + dr < h and 0 <= c + dc < w and not cal.bad.flat[f_ind[r + dr, c + dc]]]
+		out.flat[f_ind[r, c]] = np.mean(res.flat[nbrs]) if nbrs else 0
+	return out
+
+def test_calibration(nmodules):
+	shape = (nmodules, nchannels)
+	offset = np.random.randint(-500, 500, shape)
+	drift = np.random.randint(-100, 100, (16, nmodules, 1))
+	dark = offset + drift + np.random.normal(0, 2, (16,) + shape)
+	# The noisy pixels and the pixels with small response are bad
+	noisy, dead = (1, 5), (2, 20)
+	dark[:, noisy[0], noisy[1]] += np.random.normal(0, 100, 16)
+	# The illumination does not reach the channels other than pixels including the reference ones
+	resp = np.zeros(shape)
+	pix = pixels.Calibration.pixel_channels()
+	resp[:, pix] = np.random.uniform(400, 600, (nmodules, len(pix)))
+	resp[dead] = 10
+	flat = dark + resp
+	cal = pixels.Calibration.build(dark, flat)
+	assert cal.bad[noisy] and cal.bad[dead] and cal.bad.sum() == 2
+	level = np.median(resp[:, pix])
+	assert np.allclose(cal.gain[0, pix] * resp[0, pix], level, rtol=1e-3)
+
+	data = (offset + drift[0] + resp * .5).astype(np.int16)
+	res = cal.apply(data)
+	assert res.dtype == np.float32 and np.allclose(res, reference_calibration(cal, data), atol=1e-2)
+	out = np.empty(shape, dtype=np.float32)
+	assert cal.apply(data, out) is out and np.allclose(out, res)
+	try:
+		cal.apply(data, np.empty((nmodules, 2 * nchannels), dtype=np.float32)[:, ::2])
+		assert False, 'non-contiguous output accepted'
+	except ValueError:
+		pass
+	assert np.allclose(cal.convert(data), pixels.get_image_pixels(res))
+
+	# The tables survive save and load
+	fd, path = tempfile.mkstemp('.npy')
+	os.close(fd)
+	try:
+		cal.save(path)
+		loaded = pixels.Calibration.load(path)
+	finally:
+		os.remove(path)
+	assert (loaded.bad == cal.bad).all() and np.allclose(loaded.apply(data), res)
+
+	# The noise floor keeps the noiseless sensor pixels good
+	dark = np.repeat(offset[np.newaxis], 8, axis=0)
+	dark[::2, 3, 7] += 1
+	assert not pixels.Calibration.build(dark).bad.any()
+
+def main():
+	for nmodules in (4, 8, 32):
+		test_map(nmodules)
+	# The map is rebuilt on configuration change
+	resolver = pconf.mod_resolver
+	pconf.image_fliplr = pconf.image_transpose = True
+	pconf.mod_resolver = scalar_resolver
+	try:
+		for nmodules in (4, 8):
+			test_map(nmodules)
+	finally:
+		pconf.image_fliplr = pconf.image_transpose = False
+		pconf.mod_resolver = resolver
+	test_map(8)
+	print 'pixels map: ok'
+	refs = pconf.calib_ref_channels
+	for pconf.calib_ref_channels in ((1,), (1, 2)):
+		test_calibration(8)
+	pconf.calib_ref_channels = refs
+	print 'calibration: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The T-BUS array read test running against the simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+import numpy as np
+sys.path.append('..')
+import config.tbus_conf as conf
+import tmod_defs as tm
+from tbmc_dev import TBMCDev
+from tbus_group import open_ctl
+
+conf.simulate = True
+conf.sim_time_scale = 0.
+
+def test_read_array(nchannels, controllers):
+	conf.nchannels = nchannels
+	conf.sim_controllers = controllers
+	ctl = open_ctl(conf)
+	ctl.bus_init()
+	ctls = ctl.ctls if controllers > 1 else [ctl]
+	for c in ctls:
+		c.bus_write(tm.srq_buff_addr, 'AAAA')
+	a = ctl.bus_read_array(tm.srq_buff_addr, (np.uint8, 4))
+	assert a.shape == (ctl.modules, 4)
+	assert a.flags.owndata and a.flags.writeable
+	# The result must not change with subsequent bus transactions reusing receive buffers
+	for c in ctls:
+		c.bus_write(tm.srq_buff_addr, 'BBBB')
+		for i in range(TBMCDev.rx_pool_size + 1):
+			c.bus_read(tm.status_addr, 2)
+	assert (a == ord('A')).all()
+	b = np.zeros((ctl.modules, 4), dtype=np.uint8)
+	assert ctl.bus_read_array(tm.srq_buff_addr, (np.uint8, 4), b) is b
+	assert (b == ord('B')).all()
+	if controllers == 1:
+		v = ctl.bus_read_view_(tm.srq_buff_addr, np.uint8)
+		assert not v.flags.writeable
+		try:
+			ctl.bus_read_array(tm.srq_buff_addr, (np.uint8, 4), np.zeros((ctl.modules, 8), np.uint8)[:, ::2])
+			assert False, 'non-contiguous output accepted'
+		except ValueError:
+			pass
+	ctl.close()
+
+def main():
+	for nchannels, controllers in ((1, 1), (8, 1), (8, 2)):
+		test_read_array(nchannels, controllers)
+	print 'bus_read_array: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The TBMC configuration registers shadow cache test running against the simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+sys.path.append('..')
+import config.tbus_conf as conf
+import tmod_defs as tm
+from tbmc_dev import TBMCDev, TRIG
+from tbmc_sim import TBMCSim
+from tbus_group import open_ctl
+
+conf.simulate = True
+conf.sim_time_scale = 0.
+
+def test_registers():
+	dev = TBMCSim(time_scale=0.)
+	dev.configure_freq(2, 10, 10)
+	assert dev.writes_avoided == 0
+	assert dev.io.regs[TBMCDev.wr_freq_ctl] == TBMCDev.freq_ctl(2, 10, 10)
+	dev.configure_freq(2, 10, 10)
+	assert dev.writes_avoided == 1
+	# The new value must reach the register
+	dev.configure_freq(3, 10, 10)
+	assert dev.writes_avoided == 1
+	assert dev.io.regs[TBMCDev.wr_freq_ctl] == TBMCDev.freq_ctl(3, 10, 10)
+	# The controller reset invalidates the cache
+	dev.io.regs[TBMCDev.wr_freq_ctl] = 0
+	dev.trigger(TRIG.reset)
+	dev.configure_freq(3, 10, 10)
+	assert dev.writes_avoided == 1
+	assert dev.io.regs[TBMCDev.wr_freq_ctl] == TBMCDev.freq_ctl(3, 10, 10)
+
+def test_bus_commands():
+	ctl = open_ctl(conf)
+	ctl.bus_init()
+	# Repeating the same bus command takes just the trigger write
+	ctl.bus_read(tm.status_addr, 8)
+	n = ctl.dev.writes_avoided
+	r = ctl.bus_read(tm.status_addr, 8)
+	assert ctl.dev.writes_avoided == n + 4, ctl.dev.writes_avoided - n
+	assert r == ctl.bus_read(tm.status_addr, 8)
+	# The command buffer is rewritten once the command is changed
+	ctl.bus_write(tm.srq_buff_addr, 'abcd')
+	assert ctl.bus_read(tm.srq_buff_addr, 4) == ['abcd'] * ctl.modules
+
+def main():
+	test_registers()
+	test_bus_commands()
+	print 'shadow cache: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
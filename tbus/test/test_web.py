@@ -0,0 +1,106 @@
+#!/usr/bin/python2
+
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The web server frame snapshot and stream request tests running against the simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import sys
+import socket
+import threading
+sys.path.append('../..')
+sys.path.append('../../web')
+import tbus.config.tbus_conf as conf
+
+conf.simulate = True
+conf.sim_time_scale = 0.
+
+import server
+
+def http_get(port, path):
+	"""Returns (status, headers, body) tuple"""
+	s = socket.create_connection(('127.0.0.1', port))
+	s.sendall('GET %s HTTP/1.0\r\nHost: localhost\r\n\r\n' % path)
+	r = ''
+	while True:
+		d = s.recv(65536)
+		if not d:
+			break
+		r += d
+	s.close()
+	hdr, body = r.split('\r\n\r\n', 1)
+	lines = hdr.split('\r\n')
+	return int(lines[0].split()[1]), dict([l.split(': ', 1) for l in lines[1:]]), body
+
+def main():
+	httpd = server.HttpServer(('127.0.0.1', 0), server.HttpHandler)
+	port = httpd.server_address[1]
+	t = threading.Thread(target=httpd.serve_forever)
+	t.daemon = True
+	t.start()
+
+	# The snapshot requests never open the controller
+	opened = []
+	open_ctl = server.tbus_group.open_ctl
+	def open_ctl_counted(cfg):
+		opened.append(cfg)
+		return open_ctl(cfg)
+	server.tbus_group.open_ctl = open_ctl_counted
+
+	# No frames until the service is started
+	status, hdr, body = http_get(port, '/frame')
+	assert status == 503, status
+	assert server.service is None and not opened
+
+	srv = server.get_service()
+	assert len(opened) == 1
+	# Wait the first frame
+	sub = srv.subscribe()
+	assert sub.get(1.) is not None
+	srv.unsubscribe(sub)
+	status, hdr, body = http_get(port, '/frame')
+	assert status == 200, status
+	h, w = int(hdr['X-Frame-Height']), int(hdr['X-Frame-Width'])
+	assert len(body) == 2 * h * w
+	status, hdr, body = http_get(port, '/frame.png')
+	assert status == 200, status
+	assert hdr['Content-Type'] == 'image/png' and body.startswith('\x89PNG')
+
+	# The filtered stream keeps the frame data type
+	(H, W), dtype = srv.layout[-1]
+	c = server.StreamClient(('127.0.0.1', 0), '/stream', {'filter': ['ema:0.5'], 'bin': ['2']})
+	seq, pixs = c.get()
+	assert pixs.shape == (H // 2, W // 2) and pixs.dtype == dtype
+	c.close()
+
+	# The stopped service is not restarted by snapshot requests
+	srv.stop()
+	for fmt in ('', '.npy', '.png'):
+		status, hdr, body = http_get(port, '/frame' + fmt)
+		assert status == 503, status
+	assert server.service is srv and len(opened) == 1
+
+	# The stream query is validated before the service is started
+	for query in ('bin=0', 'fps=-1', 'roi=1,2,3', 'roi=-1,0,4,4', 'bin=x', 'filter=ema:2', 'filter=foo'):
+		status, hdr, body = http_get(port, '/stream?' + query)
+		assert status == 400, (query, status)
+	assert len(opened) == 1
+
+	# The stream is not available if the service can't be started
+	def open_ctl_failed(cfg):
+		opened.append(cfg)
+		raise RuntimeError('no controllers')
+	server.tbus_group.open_ctl = open_ctl_failed
+	status, hdr, body = http_get(port, '/stream')
+	assert status == 503, status
+	assert len(opened) == 2
+
+	server.tbus_group.open_ctl = open_ctl
+	httpd.shutdown()
+	print 'frame snapshot and stream errors: ok'
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,158 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: T-MODULE emulator used by the TBMC core simulator
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import struct
+import numpy as np
+import tbus_defs as tb
+import tmod_defs as tm
+
+class TModSim:
+	"""T-module emulator answering T-BUS commands and executing SRQs"""
+	version   = 0x12
+	hw_id     = 0x32
+	mem_size  = 0x10000
+	ram_size  = 0x400
+	# The flash code buffer start address
+	code_base = 0xf000
+	# The SRQ execution time (sec)
+	srq_time       = 1e-3
+	srq_flash_time = 10e-3
+
+	def __init__(self, index, applet = None):
+		"""Create module given its index in the sensor and optional applet emulation routine"""
+		self.index  = index
+		self.applet = applet if applet is not None else ts32_applet
+		self.mem = bytearray('\xff' * TModSim.mem_size)
+		self.code_addr = TModSim.code_base
+		self.chksum = None
+		self.frame = 0
+		self.reset()
+
+	def reset(self):
+		"""Hard reset. Clears RAM content."""
+		self.mem[tm.ram_base:tm.ram_base+TModSim.ram_size] = '\0' * TModSim.ram_size
+		self.flags = tm.hard_reset | tm.chksum_valid
+		self.srq_status = tm.SRQ_NOT_CONFIGURED
+
+	def update_status(self):
+		"""Update system status in the memory"""
+		if self.chksum is None:
+			self.chksum = tm.get_chksum(str(self.mem[self.code_addr:]))
+		struct.pack_into('BBBBIH', self.mem, tm.status_addr,
+			TModSim.version, TModSim.hw_id, self.flags, self.srq_status, self.chksum,
+			(300 * 1024) // 404 # 300K
+		)
+
+	def process(self, code, addr, data_len, data):
+		"""Process T-BUS command. The data is the bytearray passed to the next module. Returns status."""
+		if addr + data_len > TModSim.mem_size:
+			return 1
+		if code in (tb.cmd_enum, tb.cmd_wait, tb.cmd_test):
+			pass
+		elif code == tb.cmd_write:
+			self.mem[addr:addr+data_len] = data
+		elif code == tb.cmd_poll:
+			self.update_status()
+			for i in range(data_len // 2):
+				v = self.mem[addr+i]
+				data[2*i] |= v
+				data[2*i+1] &= v
+		elif code == tb.cmd_read:
+			self.update_status()
+			data += self.mem[addr:addr+data_len]
+		else:
+			return 1
+		return 0
+
+	def srq(self):
+		"""Execute SRQ stored in the memory. Returns its execution time."""
+		code, param, addr = struct.unpack_from('BBH', self.mem, tm.srq_addr)
+		code &= ~tm.srq_sync
+		self.flags &= ~tm.hard_reset
+		self.srq_status, t = tm.SRQ_SUCCESS, TModSim.srq_time
+		if code & tm.srq_flash_ers_wrt:
+			t = TModSim.srq_flash_time
+			if code & tm.srq_flash_ers:
+				# Erase code buffer starting from the given address
+				start = addr if code & tm.srq_flash_wrt else TModSim.code_base
+				if start < TModSim.code_base or start % tm.seg_size:
+					self.srq_status = tm.SRQ_INVALID
+					return t
+				self.mem[start:] = '\xff' * (TModSim.mem_size - start)
+				self.code_addr = start
+			if code & tm.srq_flash_wrt:
+				if addr < self.code_addr or addr + param > TModSim.mem_size:
+					self.srq_status = tm.SRQ_INVALID
+					return t
+				for i, v in enumerate(self.mem[tm.srq_buff_addr:tm.srq_buff_addr+param]):
+					self.mem[addr+i] &= v
+			self.chksum = None
+		elif code == tm.srq_proc:
+			self.applet(self, addr)
+			self.frame += 1
+		elif code != tm.srq_none:
+			self.srq_status = tm.SRQ_INVALID
+		return t
+
+def process_cmd(modules, cmd):
+	"""Pass T-BUS command through the chain of modules. Returns the response string."""
+	code, len1, addr, cookie, status, r_cnt = struct.unpack(tb.hdr_fmt, cmd[:tb.hdr_sz])
+	data_len = len1 + 1 if code & tb.cmd_has_data_ else 0
+	data = bytearray(cmd[tb.hdr_sz:])
+	if code != tb.cmd_read and len(data) != data_len:
+		status |= 1
+	for m in modules:
+		status |= m.process(code, addr, data_len, data)
+		r_cnt += 1
+	return struct.pack(tb.hdr_fmt, code, len1, addr, cookie, status, r_cnt) + str(data)
+
+def cmd_length(cmd, off = 0):
+	"""Returns the length of T-BUS command starting at the given offset"""
+	code, len1 = struct.unpack_from('BB', cmd, off)
+	if code & tb.cmd_has_data_ and code != tb.cmd_read:
+		return tb.hdr_sz + len1 + 1
+	return tb.hdr_sz
+
+def process_cmds(modules, cmd):
+	"""
+	Pass the sequence of T-BUS commands through the chain of modules. The zero bytes
+	between commands are idle bytes passed as is. Returns the response string.
+	"""
+	resp, off = '', 0
+	while off < len(cmd):
+		if cmd[off] == '\0':
+			resp += '\0'
+			off += 1
+			continue
+		if len(cmd) - off < tb.hdr_sz:
+			# Truncated header is passed untouched
+			resp += cmd[off:]
+			break
+		sz = cmd_length(cmd, off)
+		resp += process_cmd(modules, cmd[off:off+sz])
+		off += sz
+	return resp
+
+#
+# Applets emulation
+#
+
+ts32_channels = 35
+ts32_pixels   = 32
+
+def ts32_applet(mod, addr):
+	"""
+	Emulate TS32 measuring applet. The results are placed to the SRQ buffer after
+	the applet parameters. The pixels show slowly moving wave pattern with some noise.
+	"""
+	phase = 0.05 * mod.frame + 0.5 * mod.index
+	pix = 300 + 200 * np.sin(phase + 0.2 * np.arange(ts32_pixels))
+	vals = np.empty(ts32_channels, dtype=np.int16)
+	vals[:3] = (2, 30, 600)
+	vals[3:] = pix + np.random.randint(-4, 5, ts32_pixels)
+	off = tm.srq_buff_addr + 4
+	mod.mem[off:off+2*ts32_channels] = vals.tobytes()
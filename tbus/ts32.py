@@ -13,6 +13,9 @@ import struct
 import tmod_defs as tmod
 import msp430txt as ldr
 from tbmc_dev import TRIG
+from tbus_group import TBUSGroup
+from frame_ring import FrameRing
+from aio import Return
 from tmod_hlp import *
 import log
 
@@ -22,6 +25,10 @@ max_data_value = 1024
 
 def configure(ctl, conf):
 	"""Reset modules, load applet if necessary and configure timeout"""
+	if isinstance(ctl, TBUSGroup):
+		ctl.map(configure, conf)
+		return
+
 	path = os.path.join(os.path.dirname(conf.__file__), conf.code_path)
 	log.dbg('using code path %s', path)
 	segs = ldr.load_file(path)
@@ -55,8 +62,18 @@ def configure(ctl, conf):
 	else:
 		log.notice('applet is already loaded to flash')
 
-def acquire(ctl, conf):
-	"""Execute applet and returns results as numpy array"""
+def acquire(ctl, conf, out = None):
+	"""
+	Execute applet and returns results as numpy array. The caller may provide
+	the (modules, data_channels) int16 array to put results to.
+	"""
+	if isinstance(ctl, TBUSGroup):
+		if out is None:
+			out = np.empty((ctl.modules, data_channels), dtype=np.int16)
+		parts = dict(zip(ctl.ctls, ctl.split(out)))
+		ctl.map(lambda c: acquire(c, conf, parts[c]))
+		return out
+
 	log.notice('starting applet ..')
 	srq_sync(ctl, tmod.srq_proc, 0, conf._start_address, struct.pack(
 			'HBB',
@@ -66,36 +83,96 @@ def acquire(ctl, conf):
 		), conf.read_delay)
 	log.notice("reading results ..")
 	buff, ranges = ctl.bus_read_(tmod.srq_buff_addr + 4, data_len)
-	return array_from_buff(buff, ranges, ctl.modules)
-
-def array_from_buff(buff, ranges, modules):
-	"""Create numpy array from raw data buffer and list of ranges"""
-	data = np.empty((modules, data_channels), dtype=np.int16)
-	off = 0
-	for r in ranges:
-		sz = r.stop - r.start
-		data.data[off:off+sz] = buff[r]
-		off += sz
-	assert off == len(data.data)
-	return data
+	return array_from_buff(buff, ranges, ctl.modules, out)
+
+def array_from_buff(buff, ranges, modules, out = None):
+	"""
+	Create numpy array from raw data buffer and list of ranges. The data of all channels is copied
+	by single strided copy skipping the gaps between ranges. The caller may provide
+	the (modules, data_channels) int16 array to copy data to.
+	"""
+	if out is None:
+		out = np.empty((modules, data_channels), dtype=np.int16)
+	assert out.shape == (modules, data_channels) and out.dtype == np.int16
+	chs, sz = len(ranges), ranges[0].stop - ranges[0].start
+	stride = ranges[1].start - ranges[0].start if chs > 1 else sz
+	assert chs * sz == out.nbytes
+	chain = sz // data_len
+	src = np.ndarray((chs, chain, data_channels), dtype=np.int16,
+			buffer=buff, offset=ranges[0].start, strides=(stride, data_len, 2))
+	# Split the modules axis of the output by strided view since reshape copies non-contiguous array
+	s0, s1 = out.strides
+	np.copyto(np.lib.stride_tricks.as_strided(out, src.shape, (chain * s0, s0, s1)), src)
+	return out
 
 def run_auto(ctl):
 	"""
 	Switch to auto mode. The caller should acquire at least one data frame in normal mode
 	before switching to auto mode.
 	"""
+	if isinstance(ctl, TBUSGroup):
+		ctl.map(run_auto)
+		return
+
 	ctl.dev.trigger(TRIG.auto)
 
-def acquire_auto(ctl, idle_cb=None):
-	"""Acquire next data frame in auto mode"""
+def acquire_auto(ctl, idle_cb=None, out=None):
+	"""
+	Acquire next data frame in auto mode. Note that in case of the controllers group
+	the idle callback is called from the worker threads as well. The caller may provide
+	the (modules, data_channels) int16 array to put the frame to.
+	"""
+	if isinstance(ctl, TBUSGroup):
+		if out is None:
+			out = np.empty((ctl.modules, data_channels), dtype=np.int16)
+		parts = dict(zip(ctl.ctls, ctl.split(out)))
+		ctl.map(lambda c: acquire_auto(c, idle_cb, parts[c]))
+		return out
+
 	buff, ranges = ctl.bus_read_auto_(data_len, idle_cb=idle_cb)
-	return array_from_buff(buff, ranges, ctl.modules)
+	return array_from_buff(buff, ranges, ctl.modules, out)
+
+def acquire_auto_async(ctl, out=None):
+	"""
+	The coroutine version of acquire_auto (see aio). The controllers of the group
+	are read concurrently by the same event loop.
+	"""
+	if isinstance(ctl, TBUSGroup):
+		if out is None:
+			out = np.empty((ctl.modules, data_channels), dtype=np.int16)
+		yield [acquire_auto_async(c, part) for c, part in zip(ctl.ctls, ctl.split(out))]
+		raise Return(out)
+
+	buff, ranges = yield ctl.bus_read_auto_async_(data_len)
+	raise Return(array_from_buff(buff, ranges, ctl.modules, out))
+
+def frame_ring(ctl, capacity, policy = FrameRing.drop_oldest, convert = None):
+	"""
+	Create the ring of frames to be filled by acquire_auto_ring. Every frame consists of the raw data array
+	and optionally the result of its conversion by the convert(data, out) routine (like pixels.get_image_pixels).
+	"""
+	layout = [((ctl.modules, data_channels), np.int16)]
+	if convert is not None:
+		sample = convert(np.zeros(layout[0][0], dtype=np.int16), None)
+		layout.append((sample.shape, sample.dtype))
+	return FrameRing(capacity, layout, policy)
+
+def acquire_auto_ring(ctl, ring, idle_cb=None, convert=None, tout=None):
+	"""
+	Acquire next data frame in auto mode into the ring created by frame_ring. The convert routine
+	should be the same as passed to frame_ring. The tout limits waiting the consumer in case
+	the ring has block policy. Returns the frame sequence number or None if it was dropped.
+	"""
+	arrays = ring.put()
+	acquire_auto(ctl, idle_cb, out=arrays[0])
+	if convert is not None:
+		convert(arrays[0], arrays[1])
+	return ring.commit(tout)
 
 
 if __name__ == '__main__':
 	import getopt, time
-	from tbmc_dev import TBMCDev
-	from tbus_ctl import TBUSCtl
+	from tbus_group import open_ctl
 	import config.tbus_conf as tbus_conf
 	import config.ts32_conf as applet_conf
 
@@ -139,7 +216,7 @@ All Rights Reserved
 				print info
 				return 0
 
-		ctl = TBUSCtl(TBMCDev(), tbus_conf)
+		ctl = open_ctl(tbus_conf)
 		ctl.bus_init()
 
 		configure(ctl, applet_conf)
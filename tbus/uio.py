@@ -0,0 +1,70 @@
+# (C) 2018-2019 TeraSense Inc. http://terasense.com/
+# All Rights Reserved
+#
+# Description: The userspace IO interrupt helper
+#
+# Author: Oleg Volkov olegv142@gmail.com
+
+import os
+import glob
+import struct
+import select
+
+class UIO:
+	"""
+	The interrupt of the device exported by UIO driver (uio_pdrv_genirq). The interrupt
+	should be armed before waiting. The file descriptor may be used with select / epoll as well.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.fd = os.open(path, os.O_RDWR)
+
+	@staticmethod
+	def find(addr):
+		"""Returns the path to UIO device mapping the given physical address or None"""
+		for path in glob.glob('/sys/class/uio/uio*'):
+			try:
+				with open(os.path.join(path, 'maps', 'map0', 'addr')) as f:
+					if int(f.read().strip(), 16) == addr:
+						return os.path.join('/dev', os.path.basename(path))
+			except (IOError, ValueError):
+				pass
+		return None
+
+	@staticmethod
+	def open(addr):
+		"""Open UIO device mapping the given physical address. Returns None if not available."""
+		path = UIO.find(addr)
+		if path is None:
+			return None
+		try:
+			return UIO(path)
+		except OSError:
+			return None
+
+	def __str__(self):
+		return self.path
+
+	def fileno(self):
+		return self.fd
+
+	def arm(self):
+		"""Enable interrupt"""
+		os.write(self.fd, struct.pack('I', 1))
+
+	def ack(self):
+		"""Consume interrupt event. Returns the total number of events."""
+		return struct.unpack('I', os.read(self.fd, 4))[0]
+
+	def wait(self, tout = None):
+		"""Wait the armed interrupt. Returns True if the interrupt has fired."""
+		r, _, _ = select.select([self.fd], [], [], tout)
+		if not r:
+			return False
+		self.ack()
+		return True
+
+	def close(self):
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
@@ -7,64 +7,349 @@
 #
 # Author: Oleg Volkov olegv142@gmail.com
 
-import sys, os, base64, json, socket
+import sys, os, time, base64, json, socket, struct, hashlib, threading, zlib
+from cStringIO import StringIO
 from SocketServer import TCPServer, ThreadingMixIn
 from SimpleHTTPServer import SimpleHTTPRequestHandler
-from urlparse import urlparse
+from urlparse import urlparse, parse_qs
+import numpy as np
 
 cur_dir = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.join(cur_dir, '..'))
 
-from tbus import tbmc_dev, tbus_ctl, ts32, pixels
+from tbus import tbus_group, pixels, filters
+from tbus.acq_service import AcqService
+from tbus.frame_codec import FrameEncoder
 import tbus.config.tbus_conf as tbus_conf
 import tbus.config.ts32_conf as applet_conf
 
 PORT = 80
 TIMEOUT = 1.
+# The number of frames queued per streaming client. The client falling behind skips to the newest frame.
+QUEUE_DEPTH = 2
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_BINARY = 0x82
+
+def ws_msg_hdr(code, sz):
+	"""Returns unmasked server message header given its opcode and payload size"""
+	if sz < 126:
+		return struct.pack('>BB', code, sz)
+	if sz < 0x10000:
+		return struct.pack('>BBH', code, 126, sz)
+	return struct.pack('>BBQ', code, 127, sz)
+
+service = None
+service_lock = threading.Lock()
+
+def get_service():
+	"""
+	Returns the acquisition service shared by all clients. It is started by the first client
+	and keeps running after that. The failed service is restarted.
+	"""
+	global service
+	with service_lock:
+		if service is not None and not service.running:
+			service.stop()
+			service = None
+		if service is None:
+			s = AcqService(tbus_group.open_ctl(tbus_conf), applet_conf, pixels.get_image_pixels)
+			try:
+				s.start()
+			except:
+				s.stop()
+				raise
+			service = s
+		return service
+
+def png_encode(pixs):
+	"""Returns 8 bit grayscale PNG image of the frame scaled to its min..max range"""
+	h, w = pixs.shape
+	lo, hi = float(pixs.min()), float(pixs.max())
+	rows = np.zeros((h, w + 1), dtype=np.uint8)  # every row starts with zero filter type byte
+	np.copyto(rows[:, 1:], (pixs - lo) * (255. / max(1., hi - lo)) + .5, casting='unsafe')
+	def chunk(tag, data):
+		return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+	return '\x89PNG\r\n\x1a\n' + \
+		chunk('IHDR', struct.pack('>IIBBBBB', w, h, 8, 0, 0, 0, 0)) + \
+		chunk('IDAT', zlib.compress(rows.tobytes())) + \
+		chunk('IEND', '')
+
+def npy_encode(pixs):
+	f = StringIO()
+	np.save(f, pixs)
+	return f.getvalue()
+
+class FrameCache:
+	"""
+	The encodings of the last frame acquired by the shared service. The frame is taken without
+	any bus transactions. Every encoding is made once per frame sequence number.
+	"""
+	formats = {
+		''     : ('application/octet-stream', lambda pixs: pixs.astype('<i2').tobytes()),
+		'.npy' : ('application/octet-stream', npy_encode),
+		'.png' : ('image/png', png_encode),
+	}
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.seq = None
+		self.pixs = None
+		self.data = {}
+
+	def get(self, fmt):
+		"""
+		Returns (seq, shape, content type, data) tuple or None if there are no frames available.
+		The service is never started here so polling never causes bus transactions.
+		"""
+		srv = service
+		if srv is None or not srv.running:
+			return None
+		with srv.lock:
+			seq = srv.last[0] if srv.last is not None else None
+		if seq is None:
+			return None
+		ctype, encode = FrameCache.formats[fmt]
+		with self.lock:
+			if seq != self.seq:
+				self.seq, arrays = srv.latest()
+				self.pixs = arrays[-1]
+				self.data = {}
+			if fmt not in self.data:
+				self.data[fmt] = encode(self.pixs)
+			return self.seq, self.pixs.shape, ctype, self.data[fmt]
+
+frame_cache = FrameCache()
+
+clients = []
+clients_lock = threading.Lock()
+
+class StreamClient:
+	"""
+	The streaming client fed by the shared service through its own bounded queue. If the client
+	is falling behind the oldest queued frames are overwritten so it never stalls other clients.
+	The client may request the part of the frame and the frame rate by query parameters:
+	  roi=x,y,w,h  - the region of interest
+	  bin=<n>      - average n x n pixel blocks
+	  fps=<rate>   - the maximum frame rate
+	  filter=<f>   - the temporal filter: ema:<alpha>, box:<n>, min, max or range
+	The filtered frames are converted back to the frame data type.
+	"""
+	def __init__(self, addr, path, query):
+		"""
+		Create client given its address, the request path and parsed query. Raise ValueError if the query
+		is invalid or RuntimeError if the acquisition can't be started.
+		"""
+		self.addr = addr
+		self.path = path
+		roi = map(int, query['roi'][-1].split(',')) if 'roi' in query else None
+		b = self.bin = int(query.get('bin', [1])[-1])
+		fps = float(query.get('fps', [0])[-1])
+		frame_filter = filters.make_filter(query.get('filter', [''])[-1])
+		if b < 1 or fps < 0 or (roi is not None and (len(roi) != 4 or min(roi) < 0)):
+			raise ValueError('invalid stream parameters')
+		# The service is started only for the valid request
+		try:
+			self.service = get_service()
+		except Exception as e:
+			print >> sys.stderr, "failed to start acquisition:", e
+			raise RuntimeError('acquisition is not available')
+		(H, W), dtype = self.service.layout[-1]
+		x, y, w, h = roi if roi is not None else (0, 0, W, H)
+		if w < b or h < b or x + w > W or y + h > H:
+			raise ValueError('invalid stream parameters')
+		h, w = h - h % b, w - w % b
+		self.roi = (slice(y, y + h), slice(x, x + w))
+		self.shape = (h // b, w // b)
+		self.period = 1. / fps if fps else 0
+		self.next = 0
+		# The cropped or binned frame is put to the preallocated array
+		self.out = np.empty(self.shape, dtype=dtype) if (h, w, b) != (H, W, 1) or frame_filter is not None else None
+		if b > 1:
+			self.acc = np.empty(self.shape, dtype=np.int32 if dtype.kind in 'iu' and frame_filter is None else np.float32)
+		self.frames = self.service.subscribe(QUEUE_DEPTH, frame_filter=frame_filter)
+		self.seq = None
+		self.sent = 0
+		with clients_lock:
+			clients.append(self)
+
+	def get(self):
+		"""Wait the next frame. Returns (seq, pixels) tuple or None if the service is stopped."""
+		if self.period:
+			t = time.time()
+			if t < self.next:
+				time.sleep(self.next - t)
+			self.next = max(self.next, t) + self.period
+		r = self.frames.get()
+		# Skip to the newest frame if the frame rate is limited
+		while r is not None and self.period and self.frames.lag():
+			r = self.frames.get(0)
+		if r is None:
+			return None
+		self.seq, arrays = r
+		self.sent += 1
+		pixs = arrays[-1]
+		if self.out is None:
+			return self.seq, pixs
+		pixs = pixs[self.roi]
+		if self.bin > 1:
+			b = self.bin
+			h, w = self.shape
+			np.sum(pixs.reshape(h, b, w, b), axis=(1, 3), dtype=self.acc.dtype, out=self.acc)
+			np.true_divide(self.acc, b * b, out=self.out, casting='unsafe')
+		else:
+			np.copyto(self.out, pixs, casting='unsafe')
+		return self.seq, self.out
+
+	def close(self):
+		with clients_lock:
+			clients.remove(self)
+		self.frames.close()
+
+	def stats(self):
+		"""Returns the client statistics as dictionary"""
+		s = self.frames.stats()
+		return {
+			'addr'    : '%s:%d' % self.addr,
+			'path'    : self.path,
+			'frames'  : self.sent,
+			'lag'     : self.service.seq - 1 - self.seq if self.seq is not None else 0,
+			'queued'  : s['pending'],
+			'dropped' : s['overwritten'] + s['dropped'],
+		}
 
 class HttpHandler(SimpleHTTPRequestHandler):
 	protocol_version = 'HTTP/2.0'
 
-	def getEventsStream(self):
-		ctl = tbus_ctl.TBUSCtl(tbmc_dev.TBMCDev(), tbus_conf)
-		ctl.bus_init()
-		ts32.configure(ctl, applet_conf)
+	def getEventsStream(self, query):
+		# The frames are acquired by the shared service thread so writing to the socket does not stall
+		# acquisition. The client always gets the latest frame.
+		try:
+			client = StreamClient(self.client_address, self.path, query)
+		except ValueError:
+			return self.send_error(400, 'Invalid stream parameters')
+		except RuntimeError:
+			return self.send_error(503, 'Acquisition is not available')
+		try:
+			h, w = client.shape
 
-		data = ts32.acquire(ctl, applet_conf)
-		pixs = pixels.get_image_pixels(data)
-		h, w = pixs.shape
+			self.send_response(200)
+			self.send_header('Cache-Control', 'no-cache')
+			self.send_header('Content-Type','text/event-stream')
+			self.end_headers()
 
-		self.send_response(200)
-		self.send_header('Cache-Control', 'no-cache')
-		self.send_header('Content-Type','text/event-stream')
-		self.end_headers()
+			self.wfile.write('event: setup\r\n')
+			self.wfile.write('data: %s\r\n' % json.dumps({'height': h, 'width': w}))
+			self.wfile.write('\r\n')
 
-		self.wfile.write('event: setup\r\n')
-		self.wfile.write('data: %s\r\n' % json.dumps({'height': h, 'width': w}))
-		self.wfile.write('\r\n')
+			while True:
+				r = client.get()
+				if r is None:
+					break
+				seq, pixs = r
+				self.wfile.write('event: frame\r\n')
+				self.wfile.write('data: %s\r\n' % base64.b64encode(pixs))
+				self.wfile.write('\r\n')
+		finally:
+			client.close()
 
-		ts32.run_auto(ctl)
+	def getWebSocketStream(self, query):
+		# The frames are sent as binary messages each in a single write straight from the encoder buffer.
+		# The message is the frame encoded by FrameEncoder according to the query parameters:
+		#   enc=raw|xor|diff  - the delta mode
+		#   key=<n>           - the key frames interval
+		#   zlib=<level>      - the compression level
+		#   q8=1              - quantize to 8 bits
+		key = self.headers.getheader('Sec-WebSocket-Key')
+		if self.headers.getheader('Upgrade', '').lower() != 'websocket' or not key:
+			return self.send_error(400, 'WebSocket upgrade expected')
+		try:
+			enc = FrameEncoder(
+					FrameEncoder.modes[query.get('enc', ['raw'])[-1]],
+					int(query.get('key', [30])[-1]),
+					int(query.get('zlib', [0])[-1]),
+					query.get('q8', ['0'])[-1] not in ('0', '')
+				)
+		except (KeyError, ValueError):
+			return self.send_error(400, 'Invalid stream encoding')
+		try:
+			client = StreamClient(self.client_address, self.path, query)
+		except ValueError:
+			return self.send_error(400, 'Invalid stream parameters')
+		except RuntimeError:
+			return self.send_error(503, 'Acquisition is not available')
+		try:
+			accept = base64.b64encode(hashlib.sha1(key + WS_GUID).digest())
+			self.close_connection = 1
+			self.wfile.write(
+				'HTTP/1.1 101 Switching Protocols\r\n'
+				'Upgrade: websocket\r\n'
+				'Connection: Upgrade\r\n'
+				'Sec-WebSocket-Accept: %s\r\n\r\n' % accept
+			)
+			while True:
+				r = client.get()
+				if r is None:
+					break
+				seq, pixs = r
+				self.connection.sendall(enc.encode(seq, pixs, lambda sz: ws_msg_hdr(WS_BINARY, sz)))
+		finally:
+			client.close()
 
-		while True:
-			self.wfile.write('event: frame\r\n')
-			self.wfile.write('data: %s\r\n' % base64.b64encode(pixs))
-			self.wfile.write('\r\n')
+	def getClients(self):
+		with clients_lock:
+			stats = [c.stats() for c in clients]
+		body = json.dumps(stats)
+		self.send_response(200)
+		self.send_header('Cache-Control', 'no-cache')
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', len(body))
+		self.end_headers()
+		self.wfile.write(body)
 
-			data = ts32.acquire_auto(ctl)
-			pixs = pixels.get_image_pixels(data)
+	def getFrame(self, fmt):
+		r = frame_cache.get(fmt)
+		if r is None:
+			return self.send_error(503, 'No frames available')
+		seq, (h, w), ctype, data = r
+		self.send_response(200)
+		self.send_header('Cache-Control', 'no-cache')
+		self.send_header('Content-Type', ctype)
+		self.send_header('Content-Length', len(data))
+		self.send_header('X-Frame-Seq', seq)
+		self.send_header('X-Frame-Height', h)
+		self.send_header('X-Frame-Width', w)
+		self.end_headers()
+		self.wfile.write(data)
 
 	def do_GET(self):
 		url = urlparse(self.path)
 		if url.path == '/stream':
-			return self.getEventsStream()
+			return self.getEventsStream(parse_qs(url.query))
+		if url.path == '/ws':
+			return self.getWebSocketStream(parse_qs(url.query))
+		if url.path == '/clients':
+			return self.getClients()
+		if url.path.startswith('/frame') and url.path[len('/frame'):] in FrameCache.formats:
+			return self.getFrame(url.path[len('/frame'):])
 		SimpleHTTPRequestHandler.do_GET(self)
 
+class HttpServer(ThreadingMixIn, TCPServer):
+	"""Serve every connection in its own thread"""
+	daemon_threads = True
+	allow_reuse_address = True
+
 def start():
 	web_dir = os.path.join(cur_dir, 'www')
 	os.chdir(web_dir)
 
 	socket.setdefaulttimeout(TIMEOUT)
-	httpd = TCPServer(("", PORT), HttpHandler)
+	# The acquisition is started in advance so the frame snapshots are available without stream clients
+	try:
+		get_service()
+	except Exception as e:
+		print >> sys.stderr, "failed to start acquisition:", e
+	httpd = HttpServer(("", PORT), HttpHandler)
 	print "serving at port", PORT
 	httpd.serve_forever()
 